@@ -6,48 +6,179 @@ from fargate_with_efs.stacks.back_end.vpc_stack import VpcStack
 from fargate_with_efs.stacks.back_end.efs_stack import EfsStack
 from fargate_with_efs.stacks.back_end.efs_content_creator_stack import EfsContentCreatorStack
 from fargate_with_efs.stacks.back_end.fargate_with_efs_stack import FargateWithEfsStack
+from fargate_with_efs.stacks.back_end.load_generator_stack import LoadGeneratorStack
 
 
 app = core.App()
 
+# Stacks are built on first use, together with the stacks they depend on
+stacks = {}
+
+
+def get_stack(stack_id):
+    if stack_id not in stacks:
+        stacks[stack_id] = STACK_BUILDERS[stack_id]()
+    return stacks[stack_id]
+
+
 # VPC Stack for hosting Secure API & Other resources
-vpc_stack = VpcStack(
-    app,
-    "vpc-stack",
-    description="Miztiik Automation: VPC to host resources for generating load on API"
-)
+def build_vpc_stack():
+    return VpcStack(
+        app,
+        "vpc-stack",
+        egress_mode=app.node.try_get_context("vpc_egress_mode") or "single-nat",
+        enable_vpc_endpoints=str(app.node.try_get_context("vpc_endpoints_enabled")).lower() == "true",
+        description="Miztiik Automation: VPC to host resources for generating load on API"
+    )
+
 
 # Create EFS
-efs_stack = EfsStack(
-    app,
-    "efs-stack",
-    vpc=vpc_stack.vpc,
-    description="Miztiik Automation: Deploy AWS Elastic File System Stack"
-)
+def build_efs_stack():
+    vpc_stack = get_stack("vpc-stack")
+    return EfsStack(
+        app,
+        "efs-stack",
+        vpc=vpc_stack.vpc,
+        vpc_subnets=vpc_stack.app_subnets,
+        performance_profile=app.node.try_get_context("efs_performance_profile") or "cost-optimised",
+        provisioned_throughput_mibps=int(app.node.try_get_context("efs_provisioned_throughput_mibps") or 0) or None,
+        description="Miztiik Automation: Deploy AWS Elastic File System Stack"
+    )
 
-# Use Lambda with API Gateway to create content in EFS
-efs_content_creator_stack = EfsContentCreatorStack(
-    app,
-    "efs-content-creator-stack",
-    vpc=vpc_stack.vpc,
-    efs_sg=efs_stack.efs_sg,
-    efs_share=efs_stack.efs_share,
-    efs_ap_nginx=efs_stack.efs_ap_nginx,
-    stack_log_level="INFO",
-    back_end_api_name="efs-content-creator",
-    description="Miztiik Automation: Use Lambda with API Gateway to create content in EFS"
-)
 
 # Persistent storage with containerized workload like Fargate
-fargate_with_efs = FargateWithEfsStack(
-    app,
-    "fargate-with-efs",
-    custom_vpc=vpc_stack.vpc,
-    efs_share=efs_stack.efs_share,
-efs_ap_nginx=efs_stack.efs_ap_nginx,
-    enable_container_insights=True,
-    description="Persistent storage with containerized workload like Fargate"
-)
+def build_fargate_with_efs_stack():
+    # nginx keeps the size of a file in open_file_cache for open_file_cache_valid. A page the
+    # flock publish mode rewrites in place would be served truncated meanwhile, & cached by the CDN.
+    if (app.node.try_get_context("greeter_publish_mode") or "atomic") != "atomic":
+        raise ValueError(
+            "fargate-with-efs needs greeter_publish_mode atomic, nginx open_file_cache serves pages rewritten in place truncated")
+    vpc_stack = get_stack("vpc-stack")
+    efs_stack = get_stack("efs-stack")
+    return FargateWithEfsStack(
+        app,
+        "fargate-with-efs",
+        custom_vpc=vpc_stack.vpc,
+        efs_share=efs_stack.efs_share,
+        efs_ap_nginx=efs_stack.efs_ap_nginx,
+        task_subnets=vpc_stack.app_subnets,
+        enable_container_insights=True,
+        task_cpu=int(app.node.try_get_context("web_task_cpu") or 256),
+        task_memory_mib=int(app.node.try_get_context("web_task_memory_mib") or 512),
+        min_task_count=int(app.node.try_get_context("web_min_task_count") or 1),
+        max_task_count=int(app.node.try_get_context("web_max_task_count") or 1),
+        requests_per_target=int(app.node.try_get_context("web_scale_requests_per_target") or 1000),
+        target_cpu_percent=int(app.node.try_get_context("web_scale_cpu_percent") or 60),
+        scale_in_cooldown_secs=int(app.node.try_get_context("web_scale_in_cooldown_secs") or 120),
+        scale_out_cooldown_secs=int(app.node.try_get_context("web_scale_out_cooldown_secs") or 30),
+        enable_cdn=str(app.node.try_get_context("web_cdn_enabled")).lower() == "true",
+        cdn_html_ttl_secs=int(app.node.try_get_context("web_cdn_html_ttl_secs") or 300),
+        nginx_image=app.node.try_get_context("web_nginx_image") or "nginx:1.19.2-alpine",
+        build_nginx_image=str(app.node.try_get_context("web_build_nginx_image")).lower() != "false",
+        health_check_grace_secs=int(app.node.try_get_context("web_health_check_grace_secs") or 20),
+        enable_efs_mirror=str(app.node.try_get_context("web_efs_mirror_enabled")).lower() == "true",
+        efs_mirror_poll_secs=float(app.node.try_get_context("web_efs_mirror_poll_secs") or 1),
+        description="Persistent storage with containerized workload like Fargate"
+    )
+
+
+# Use Lambda with API Gateway to create content in EFS
+def build_efs_content_creator_stack():
+    vpc_stack = get_stack("vpc-stack")
+    efs_stack = get_stack("efs-stack")
+    # Needs the web service only for its edge cache, so the greeter can invalidate it
+    cdn_distribution_id = ""
+    if str(app.node.try_get_context("web_cdn_enabled")).lower() == "true":
+        cdn_distribution_id = get_stack("fargate-with-efs").cdn_distribution_id
+    return EfsContentCreatorStack(
+        app,
+        "efs-content-creator-stack",
+        vpc=vpc_stack.vpc,
+        efs_sg=efs_stack.efs_sg,
+        vpc_subnets=vpc_stack.app_subnets,
+        efs_share=efs_stack.efs_share,
+        efs_ap_nginx=efs_stack.efs_ap_nginx,
+        stack_log_level="INFO",
+        back_end_api_name="efs-content-creator",
+        write_mode=app.node.try_get_context("greeter_write_mode") or "direct",
+        publish_mode=app.node.try_get_context("greeter_publish_mode") or "atomic",
+        gzip_level=int(app.node.try_get_context("greeter_gzip_level") or 0),
+        enable_history=str(app.node.try_get_context("greeter_history_enabled")).lower() == "true",
+        enable_site=str(app.node.try_get_context("greeter_site_enabled")).lower() == "true",
+        cdn_distribution_id=cdn_distribution_id,
+        runtime=app.node.try_get_context("greeter_runtime") or "python3.7",
+        architecture=app.node.try_get_context("greeter_architecture") or "x86_64",
+        provisioned_concurrency=int(app.node.try_get_context("greeter_provisioned_concurrency") or 0),
+        max_provisioned_concurrency=int(app.node.try_get_context("greeter_max_provisioned_concurrency") or 0),
+        provisioned_utilization_target=float(app.node.try_get_context("greeter_provisioned_utilization_target") or 0.7),
+        provisioned_schedules=app.node.try_get_context("greeter_provisioned_schedules") or [],
+        enable_async_ingestion=str(app.node.try_get_context("greeter_async_ingestion_enabled")).lower() == "true",
+        sqs_batch_size=int(app.node.try_get_context("greeter_sqs_batch_size") or 100),
+        sqs_batch_window_secs=int(app.node.try_get_context("greeter_sqs_batch_window_secs") or 5),
+        description="Miztiik Automation: Use Lambda with API Gateway to create content in EFS"
+    )
+
+
+# Capacity test EFS, nginx & the greeter from inside the VPC
+def build_load_generator_stack():
+    vpc_stack = get_stack("vpc-stack")
+    return LoadGeneratorStack(
+        app,
+        "load-generator-stack",
+        vpc=vpc_stack.vpc,
+        vpc_subnets=vpc_stack.app_subnets,
+        post_url=get_stack("efs-content-creator-stack").create_content_url,
+        get_url=get_stack("fargate-with-efs").web_app_url,
+        task_count=int(app.node.try_get_context("load_gen_task_count") or 1),
+        rate=float(app.node.try_get_context("load_gen_rate") or 50),
+        concurrency=int(app.node.try_get_context("load_gen_concurrency") or 20),
+        duration_secs=int(app.node.try_get_context("load_gen_duration_secs") or 300),
+        payload_bytes=int(app.node.try_get_context("load_gen_payload_bytes") or 128),
+        post_ratio=float(app.node.try_get_context("load_gen_post_ratio") or 0.1),
+        description="Miztiik Automation: Generate load on the API & the web service from within the VPC"
+    )
+
+
+STACK_BUILDERS = {
+    "vpc-stack": build_vpc_stack,
+    "efs-stack": build_efs_stack,
+    "fargate-with-efs": build_fargate_with_efs_stack,
+    "efs-content-creator-stack": build_efs_content_creator_stack,
+    "load-generator-stack": build_load_generator_stack
+}
+
+# Only build the requested stacks & their dependencies, e.g. cdk synth -c stacks=efs-stack,fargate-with-efs
+# The load generator is only built when enabled or asked for by name.
+requested_stacks = app.node.try_get_context("stacks") or [
+    s for s in STACK_BUILDERS
+    if s != "load-generator-stack" or str(app.node.try_get_context("load_gen_enabled")).lower() == "true"
+]
+if isinstance(requested_stacks, str):
+    requested_stacks = [s.strip() for s in requested_stacks.split(",") if s.strip()]
+unknown_stacks = [s for s in requested_stacks if s not in STACK_BUILDERS]
+if unknown_stacks:
+    raise ValueError(f"Unknown stacks {unknown_stacks}, choose from {list(STACK_BUILDERS)}")
+
+# Without NAT the app subnets only reach AWS services with a VPC endpoint. CloudFront has none,
+# every greeter invalidation would hang until the function timeout. The load generator drives
+# the public ALB & API, which are out of reach as well.
+if app.node.try_get_context("vpc_egress_mode") == "endpoints-only":
+    if str(app.node.try_get_context("web_cdn_enabled")).lower() == "true":
+        raise ValueError(
+            "web_cdn_enabled needs a NAT egress mode, CloudFront has no VPC endpoint for vpc_egress_mode endpoints-only")
+    if "load-generator-stack" in requested_stacks:
+        raise ValueError(
+            "The load generator needs a NAT egress mode, it can not reach the public ALB & API with vpc_egress_mode endpoints-only")
+
+# The mirror sidecar only lists directories whose mtime moved. Pages written in place by the
+# flock publish mode leave their directory untouched & would only reach nginx on a full scan.
+if str(app.node.try_get_context("web_efs_mirror_enabled")).lower() == "true" \
+        and (app.node.try_get_context("greeter_publish_mode") or "atomic") != "atomic":
+    raise ValueError(
+        "web_efs_mirror_enabled needs greeter_publish_mode atomic, the mirror does not see pages written in place")
+
+for stack_id in requested_stacks:
+    get_stack(stack_id)
 
 # Stack Level Tagging
 core.Tag.add(app, key="Owner",
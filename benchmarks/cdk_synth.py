@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Synth time benchmark for app.py.
+
+Every sample runs app.py in a fresh interpreter with -c stacks=<stack id>, so
+only that stack and the stacks it depends on are built, and records:
+    - process_ms: wall time of the whole run, including the jsii runtime start
+    - construct_ms: time spent in app.py before app.synth(), building the stacks
+    - synth_ms: time spent in app.synth()
+
+"all" builds every stack, like a plain cdk synth. The context of cdk.json is
+passed through, --context adds overrides. Results are printed as JSON.
+
+    python3 benchmarks/cdk_synth.py --runs 3
+    python3 benchmarks/cdk_synth.py --stacks efs-stack,all --context '{"web_cdn_enabled": true}'
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STACK_IDS = ["vpc-stack", "efs-stack", "fargate-with-efs", "efs-content-creator-stack"]
+
+SYNTH_SNIPPET = """
+import runpy
+import time
+from aws_cdk import core
+
+_synth = core.App.synth
+_timings = {}
+
+
+def _timed_synth(self, *args, **kwargs):
+    _timings["construct_end"] = time.perf_counter()
+    result = _synth(self, *args, **kwargs)
+    _timings["synth_end"] = time.perf_counter()
+    return result
+
+
+core.App.synth = _timed_synth
+begin = time.perf_counter()
+runpy.run_path("app.py", run_name="__main__")
+print(f"construct_ms={(_timings['construct_end'] - begin) * 1000}")
+print(f"synth_ms={(_timings['synth_end'] - _timings['construct_end']) * 1000}")
+"""
+
+
+def _run_sample(context):
+    with tempfile.TemporaryDirectory() as out_dir:
+        env = dict(
+            os.environ,
+            CDK_OUTDIR=out_dir,
+            CDK_CONTEXT_JSON=json.dumps(context),
+            JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1"
+        )
+        begin = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", SYNTH_SNIPPET],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        sample = {"process_ms": (time.perf_counter() - begin) * 1000}
+    for line in proc.stdout.splitlines():
+        if line.startswith(("construct_ms=", "synth_ms=")):
+            name, value = line.split("=", 1)
+            sample[name] = float(value)
+    return sample
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "min": samples[0],
+        "p50": statistics.median(samples),
+        "max": samples[-1],
+        "mean": statistics.mean(samples)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time app.synth() per stack")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per stack")
+    parser.add_argument("--stacks", default=",".join(STACK_IDS + ["all"]), help="Comma separated stack ids, all for every stack")
+    parser.add_argument("--context", default="{}", help="JSON object of context overrides")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_ROOT, "cdk.json")) as f:
+        base_context = json.load(f).get("context", {})
+    base_context.update(json.loads(args.context))
+
+    results = {"python": sys.version.split()[0], "runs": args.runs, "stacks": {}}
+    for stack_id in [s.strip() for s in args.stacks.split(",") if s.strip()]:
+        context = dict(base_context)
+        if stack_id != "all":
+            context["stacks"] = stack_id
+        samples = [_run_sample(context) for _ in range(args.runs)]
+        results["stacks"][stack_id] = {
+            name: _summary([s[name] for s in samples])
+            for name in ["process_ms", "construct_ms", "synth_ms"]
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the greeter Lambda.
+
+Every sample runs in a fresh interpreter, the same way a new Lambda execution
+environment would, and records:
+    - import_us: cumulative import time of serverless_greeter (python -X importtime)
+    - first_invoke_ms: latency of the first lambda_handler POST after import
+
+A temp directory stands in for the EFS mount. Results are printed as JSON so
+they can be tracked across releases.
+
+    python3 benchmarks/greeter_cold_start.py --runs 20 --out bench_output.txt
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+LAMBDA_SRC = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "fargate_with_efs", "stacks", "back_end", "lambda_src"
+)
+
+FIRST_INVOKE_SNIPPET = """
+import time
+import serverless_greeter
+class Ctx:
+    function_version = "bench"
+event = {"requestContext": {"httpMethod": "POST"}, "body": "Hello from the benchmark"}
+begin = time.perf_counter()
+serverless_greeter.lambda_handler(event, Ctx())
+print(f"first_invoke_ms={(time.perf_counter() - begin) * 1000}")
+"""
+
+
+def _run_sample(env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FIRST_INVOKE_SNIPPET],
+        cwd=LAMBDA_SRC,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    import_us = None
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.rstrip().endswith("| serverless_greeter"):
+            import_us = int(line.split("|")[1])
+    first_invoke_ms = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("first_invoke_ms="):
+            first_invoke_ms = float(line.split("=", 1)[1])
+    return import_us, first_invoke_ms
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "min": samples[0],
+        "p50": statistics.median(samples),
+        "max": samples[-1],
+        "mean": statistics.mean(samples)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure greeter Lambda cold start cost")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters to sample")
+    parser.add_argument("--write-mode", default="direct", help="WRITE_MODE for the greeter")
+    parser.add_argument("--publish-mode", default="flock", help="PUBLISH_MODE for the greeter")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    import_samples, invoke_samples = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as efs_dir:
+            env = dict(
+                os.environ,
+                EFS_MNT_PATH=efs_dir,
+                WRITE_MODE=args.write_mode,
+                PUBLISH_MODE=args.publish_mode,
+                LOG_LEVEL="WARNING",
+                PYTHONDONTWRITEBYTECODE="1"
+            )
+            import_us, first_invoke_ms = _run_sample(env)
+            import_samples.append(import_us)
+            invoke_samples.append(first_invoke_ms)
+
+    results = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "write_mode": args.write_mode,
+        "publish_mode": args.publish_mode,
+        "import_us": _summary(import_samples),
+        "first_invoke_ms": _summary(invoke_samples)
+    }
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
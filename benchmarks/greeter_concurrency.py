@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the greeter Lambda, runnable offline.
+
+A process pool stands in for concurrent Lambda execution environments. Every
+worker imports serverless_greeter against a local directory standing in for
+the EFS mount and drives lambda_handler with synthetic API Gateway proxy events.
+
+--latency-ms adds a fixed delay to every open, flock, write, fsync, stat and
+rename the greeter makes, to approximate EFS round trip times.
+
+Reports throughput, p50/p95/p99 handler latency & lock wait time as JSON.
+
+    python3 benchmarks/greeter_concurrency.py --concurrency 20 --requests 2000 --latency-ms 2
+"""
+import argparse
+import builtins
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+LAMBDA_SRC = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "fargate_with_efs", "stacks", "back_end", "lambda_src"
+)
+
+# Per worker process state, set up by _init_worker
+_greeter = None
+_lock_wait = [0.0]
+
+
+class _Ctx:
+    function_version = "bench"
+
+
+class _SlowFile:
+    """ File object wrapper that delays every write """
+
+    def __init__(self, f, delay):
+        self._f = f
+        self._delay = delay
+
+    def write(self, data):
+        time.sleep(self._delay)
+        return self._f.write(data)
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._f.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._f)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class _SlowModule:
+    """ Module proxy that delays the named functions and passes everything else through """
+
+    def __init__(self, module, names, delay):
+        self._module = module
+        self._names = names
+        self._delay = delay
+
+    def __getattr__(self, name):
+        attr = getattr(self._module, name)
+        if name not in self._names:
+            return attr
+
+        def _slow(*args, **kwargs):
+            time.sleep(self._delay)
+            return attr(*args, **kwargs)
+        return _slow
+
+
+class _TimedFcntl:
+    """ fcntl proxy that measures how long flock waits for the lock """
+
+    def __init__(self, module, delay):
+        self._module = module
+        self._delay = delay
+
+    def flock(self, fd, operation):
+        if self._delay:
+            time.sleep(self._delay)
+        if operation & self._module.LOCK_UN:
+            return self._module.flock(fd, operation)
+        begin = time.perf_counter()
+        try:
+            return self._module.flock(fd, operation)
+        finally:
+            _lock_wait[0] += time.perf_counter() - begin
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def _init_worker(env, latency_ms):
+    global _greeter
+    os.environ.update(env)
+    sys.path.insert(0, LAMBDA_SRC)
+    import serverless_greeter
+    _greeter = serverless_greeter
+
+    delay = latency_ms / 1000.0
+    _greeter.fcntl = _TimedFcntl(_greeter.fcntl, delay)
+    if delay:
+        _greeter.os = _SlowModule(os, {"open", "write", "fsync", "stat", "fstat", "replace", "remove"}, delay)
+
+        def _slow_open(*args, **kwargs):
+            time.sleep(delay)
+            return _SlowFile(builtins.open(*args, **kwargs), delay)
+        _greeter.open = _slow_open
+
+
+def _event(worker_id, i, keys, get_ratio):
+    event = {
+        "requestContext": {"httpMethod": "POST"},
+        "headers": {"Content-Type": "text/plain"},
+        "body": f"Hello from worker {worker_id}, request {i}"
+    }
+    if keys:
+        event["pathParameters"] = {"mystique": f"key-{(worker_id + i) % keys}"}
+    if get_ratio and (i % 100) < get_ratio * 100:
+        event["requestContext"]["httpMethod"] = "GET"
+        event.pop("body")
+    return event
+
+
+def _run_worker(worker_id, count, keys, get_ratio):
+    samples = []
+    for i in range(count):
+        event = _event(worker_id, i, keys, get_ratio)
+        _lock_wait[0] = 0.0
+        begin = time.perf_counter()
+        try:
+            status = _greeter.lambda_handler(event, _Ctx())["statusCode"]
+        except Exception:
+            status = 500
+        samples.append((time.perf_counter() - begin, _lock_wait[0], status))
+    return samples
+
+
+def _percentiles(values):
+    values = sorted(values)
+
+    def _pct(p):
+        return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] * 1000
+    return {"p50_ms": _pct(50), "p95_ms": _pct(95), "p99_ms": _pct(99), "max_ms": values[-1] * 1000}
+
+
+def run(args, efs_dir):
+    env = {
+        "EFS_MNT_PATH": efs_dir,
+        "WRITE_MODE": args.write_mode,
+        "PUBLISH_MODE": args.publish_mode,
+        "LOG_LEVEL": "WARNING",
+        # The EMF lines would interleave with the JSON report on stdout
+        "METRICS_ENABLED": "False"
+    }
+    per_worker = [args.requests // args.concurrency] * args.concurrency
+    for i in range(args.requests % args.concurrency):
+        per_worker[i] += 1
+
+    with ProcessPoolExecutor(
+        max_workers=args.concurrency,
+        initializer=_init_worker,
+        initargs=(env, args.latency_ms)
+    ) as pool:
+        begin = time.perf_counter()
+        futures = [
+            pool.submit(_run_worker, worker_id, count, args.keys, args.get_ratio)
+            for worker_id, count in enumerate(per_worker)
+        ]
+        samples = [s for f in futures for s in f.result()]
+        elapsed = time.perf_counter() - begin
+
+    return {
+        "python": sys.version.split()[0],
+        "concurrency": args.concurrency,
+        "requests": len(samples),
+        "write_mode": args.write_mode,
+        "publish_mode": args.publish_mode,
+        "keys": args.keys,
+        "get_ratio": args.get_ratio,
+        "latency_ms": args.latency_ms,
+        "elapsed_secs": elapsed,
+        "throughput_rps": len(samples) / elapsed,
+        "errors": sum(1 for _, _, status in samples if status >= 500),
+        "latency": _percentiles([s[0] for s in samples]),
+        "lock_wait": _percentiles([s[1] for s in samples]),
+        "lock_wait_total_secs": sum(s[1] for s in samples)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive lambda_handler concurrently against a local directory")
+    parser.add_argument("--concurrency", type=int, default=20, help="Worker processes, like reserved concurrency")
+    parser.add_argument("--requests", type=int, default=1000, help="Total invocations across all workers")
+    parser.add_argument("--write-mode", default="direct", help="WRITE_MODE for the greeter")
+    parser.add_argument("--publish-mode", default="flock", help="PUBLISH_MODE for the greeter")
+    parser.add_argument("--keys", type=int, default=0, help="Spread POSTs over this many shard keys, 0 for index.html")
+    parser.add_argument("--get-ratio", type=float, default=0.0, help="Fraction of requests that are GETs")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay injected into every file system call")
+    parser.add_argument("--efs-dir", help="Directory standing in for EFS, a temp directory by default")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.efs_dir:
+        results = run(args, args.efs_dir)
+    else:
+        with tempfile.TemporaryDirectory() as efs_dir:
+            results = run(args, efs_dir)
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
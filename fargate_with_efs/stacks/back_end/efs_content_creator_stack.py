@@ -1,8 +1,12 @@
 from aws_cdk import aws_apigateway as _apigw
+from aws_cdk import aws_applicationautoscaling as _appscaling
+from aws_cdk import aws_events as _events
+from aws_cdk import aws_events_targets as _events_targets
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_iam as _iam
 from aws_cdk import aws_ec2 as _ec2
 from aws_cdk import aws_logs as _logs
+from aws_cdk import aws_sqs as _sqs
 
 from aws_cdk import core
 
@@ -22,6 +26,20 @@ class GlobalArgs:
     MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
 
 
+GREETER_ARCHITECTURES = ["x86_64", "arm64"]
+# Lambda has no arm64 build of these runtimes
+GREETER_X86_ONLY_RUNTIMES = ["python2.7", "python3.6", "python3.7"]
+
+# API Gateway to SQS SendMessage. The content key ({mystique} or X-Content-Key) & the
+# content type travel as message attributes, the greeter groups & expands on them.
+SQS_SEND_MESSAGE_TEMPLATE = """#set($key = $input.params('mystique'))
+#if($key == "")#set($key = $input.params('X-Content-Key'))#end
+#set($contentType = $input.params('Content-Type'))
+Action=SendMessage&MessageBody=$util.urlEncode($input.body)&MessageAttribute.1.Name=ContentType&MessageAttribute.1.Value.DataType=String&MessageAttribute.1.Value.StringValue=$util.urlEncode($contentType)#if($key != "")&MessageAttribute.2.Name=ContentKey&MessageAttribute.2.Value.DataType=String&MessageAttribute.2.Value.StringValue=$util.urlEncode($key)#end"""
+
+SQS_ACCEPTED_TEMPLATE = """{"message": "Message accepted", "message_id": "$input.path('$.SendMessageResponse.SendMessageResult.MessageId')"}"""
+
+
 class EfsContentCreatorStack(core.Stack):
 
     def __init__(
@@ -34,18 +52,63 @@ class EfsContentCreatorStack(core.Stack):
         efs_ap_nginx,
         stack_log_level: str,
         back_end_api_name: str,
+        vpc_subnets=None,
+        write_mode: str = "direct",
+        publish_mode: str = "flock",
+        gzip_level: int = 6,
+        cache_max_age_secs: int = 5,
+        max_batch_size: int = 100,
+        max_body_bytes: int = 6291456,
+        enable_shard_index: bool = True,
+        log_payload_sample_rate: float = 0.0,
+        enable_idempotency: bool = True,
+        idempotency_ttl_secs: int = 300,
+        enable_history: bool = False,
+        history_capacity: int = 4096,
+        enable_site: bool = False,
+        cdn_distribution_id: str = "",
+        runtime: str = "python3.7",
+        architecture: str = "x86_64",
+        reserved_concurrency: int = 20,
+        provisioned_concurrency: int = 0,
+        max_provisioned_concurrency: int = 0,
+        provisioned_utilization_target: float = 0.7,
+        provisioned_schedules: list = None,
+        enable_async_ingestion: bool = False,
+        sqs_batch_size: int = 100,
+        sqs_batch_window_secs: int = 5,
         **kwargs
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        if architecture not in GREETER_ARCHITECTURES:
+            raise ValueError(
+                f"Unknown greeter architecture '{architecture}', choose one of {GREETER_ARCHITECTURES}")
+        if architecture == "arm64" and runtime in GREETER_X86_ONLY_RUNTIMES:
+            raise ValueError(
+                f"Greeter runtime '{runtime}' has no arm64 build, use python3.8 or later with arm64")
+        # Utilisation tracking & schedules scale the provisioned environments of the alias,
+        # without any to start from the metric they track is never published
+        if (max_provisioned_concurrency or provisioned_schedules) and provisioned_concurrency < 1:
+            raise ValueError(
+                "Greeter max provisioned concurrency & schedules need provisioned_concurrency >= 1")
+        # Provisioned environments are carved out of the reserved concurrency
+        max_provisioned_concurrency = max(max_provisioned_concurrency, provisioned_concurrency)
+        for schedule in provisioned_schedules or []:
+            max_provisioned_concurrency = max(max_provisioned_concurrency, int(schedule["max"]))
+        if max_provisioned_concurrency > reserved_concurrency:
+            raise ValueError(
+                f"Provisioned concurrency of up to {max_provisioned_concurrency} does not fit in the reserved concurrency of {reserved_concurrency}")
+
+        greeter_fn_timeout_secs = 15
+
         # Create Serverless Event Processor using Lambda):
-        # Read Lambda Code):
-        try:
-            with open("fargate_with_efs/stacks/back_end/lambda_src/serverless_greeter.py", mode="r") as f:
-                greeter_fn_code = f.read()
-        except OSError as e:
-            print("Unable to read Lambda Function Code")
-            raise e
+        # The greeter has outgrown the 4KB inline code limit, ship it as an asset
+        # Resolved next to this file, so synth works from any directory. Bytecode left behind by
+        # local runs would change the asset hash & force a new version without a code change.
+        greeter_fn_code = _lambda.Code.from_asset(
+            os.path.join(os.path.dirname(__file__), "lambda_src"),
+            exclude=["__pycache__", "*.pyc"])
 
         efs_mnt_path = "/mnt/html"
 
@@ -53,41 +116,93 @@ class EfsContentCreatorStack(core.Stack):
             self,
             "secureGreeterFn",
             function_name=f"greeter_fn_{id}",
-            runtime=_lambda.Runtime.PYTHON_3_7,
-            handler="index.lambda_handler",
-            code=_lambda.InlineCode(greeter_fn_code),
+            runtime=_lambda.Runtime(runtime, _lambda.RuntimeFamily.PYTHON),
+            handler="serverless_greeter.lambda_handler",
+            code=greeter_fn_code,
             current_version_options={
                 "removal_policy": core.RemovalPolicy.DESTROY,  # retain old versions
                 "retry_attempts": 1,
                 "description": "Mystique Factory Build Version"
             },
-            timeout=core.Duration.seconds(15),
-            reserved_concurrent_executions=20,
+            timeout=core.Duration.seconds(greeter_fn_timeout_secs),
+            reserved_concurrent_executions=reserved_concurrency,
             retry_attempts=1,
             environment={
                 "LOG_LEVEL": f"{stack_log_level}",
                 "Environment": "Production",
                 "ANDON_CORD_PULLED": "False",
                 "RANDOM_SLEEP_ENABLED": "False",
-                "EFS_MNT_PATH": efs_mnt_path
+                "EFS_MNT_PATH": efs_mnt_path,
+                "WRITE_MODE": write_mode,
+                "PUBLISH_MODE": publish_mode,
+                "GZIP_LEVEL": f"{gzip_level}",
+                "CACHE_MAX_AGE_SECS": f"{cache_max_age_secs}",
+                "MAX_BATCH_SIZE": f"{max_batch_size}",
+                "MAX_BODY_BYTES": f"{max_body_bytes}",
+                "SHARD_INDEX_ENABLED": f"{enable_shard_index}",
+                "METRICS_ENABLED": "True",
+                "METRICS_NAMESPACE": f"{GlobalArgs.OWNER}/Greeter",
+                "LOG_PAYLOAD_SAMPLE_RATE": f"{log_payload_sample_rate}",
+                "IDEMPOTENCY_ENABLED": f"{enable_idempotency}",
+                "IDEMPOTENCY_TTL_SECS": f"{idempotency_ttl_secs}",
+                "HISTORY_ENABLED": f"{enable_history}",
+                "HISTORY_CAPACITY": f"{history_capacity}",
+                "SITE_ENABLED": f"{enable_site}",
+                "CDN_DISTRIBUTION_ID": cdn_distribution_id
             },
             description="A simple greeter function, which responds with a timestamp",
             vpc=vpc,
-            vpc_subnets=_ec2.SubnetType.PRIVATE,
+            vpc_subnets=vpc_subnets or _ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE),
             security_groups=[efs_sg],
             filesystem=_lambda.FileSystem.from_efs_access_point(
                 efs_ap_nginx, efs_mnt_path)
         )
-        greeter_fn_version = greeter_fn.latest_version
+        # Invalidate the pages each write rewrites on the edge cache in front of nginx
+        if cdn_distribution_id:
+            greeter_fn.add_to_role_policy(
+                _iam.PolicyStatement(
+                    actions=["cloudfront:CreateInvalidation"],
+                    resources=[
+                        f"arn:aws:cloudfront::{core.Aws.ACCOUNT_ID}:distribution/{cdn_distribution_id}"
+                    ]
+                )
+            )
+
+        # The greeter is pure python, it runs unchanged on Graviton
+        if architecture != "x86_64":
+            greeter_fn.node.default_child.add_property_override(
+                "Architectures", [architecture])
+
+        # Provisioned concurrency needs a published version, $LATEST can not have any
+        greeter_fn_version = greeter_fn.current_version
         greeter_fn_dev_alias = _lambda.Alias(
             self,
             "greeterFnMystiqueAutomationAlias",
             alias_name="MystiqueAutomation",
             version=greeter_fn_version,
             description="Mystique Factory Build Version to ingest content from API GW to EFS",
+            provisioned_concurrent_executions=provisioned_concurrency or None,
             retry_attempts=1
         )
 
+        # Keep enough pre-initialized environments around that scale-out does not pay cold starts
+        if max_provisioned_concurrency > provisioned_concurrency:
+            greeter_fn_scaling = greeter_fn_dev_alias.add_auto_scaling(
+                min_capacity=provisioned_concurrency,
+                max_capacity=max_provisioned_concurrency
+            )
+            greeter_fn_scaling.scale_on_utilization(
+                utilization_target=provisioned_utilization_target
+            )
+            # Raise the floor ahead of known busy hours, target tracking only reacts after the fact
+            for schedule in provisioned_schedules or []:
+                greeter_fn_scaling.scale_on_schedule(
+                    f"greeterFnSchedule{schedule['name']}",
+                    schedule=_appscaling.Schedule.expression(schedule["expression"]),
+                    min_capacity=int(schedule["min"]),
+                    max_capacity=int(schedule["max"])
+                )
+
         # Create Custom Loggroup
         greeter_fn_lg = _logs.LogGroup(
             self,
@@ -97,6 +212,55 @@ class EfsContentCreatorStack(core.Stack):
             removal_policy=core.RemovalPolicy.DESTROY
         )
 
+        # Flush journal records that no later POST would trigger a compaction for, evict idempotency
+        # records that have outlived their TTL & invalidate the pages written since the last run
+        if write_mode == "journal" or enable_idempotency or cdn_distribution_id:
+            journal_compaction_rule = _events.Rule(
+                self,
+                "journalCompactionRule",
+                description="Periodically compact the greeter message journal, evict stale idempotency records & invalidate written pages on the CDN",
+                schedule=_events.Schedule.rate(core.Duration.minutes(1))
+            )
+            journal_compaction_rule.add_target(
+                _events_targets.LambdaFunction(greeter_fn_dev_alias)
+            )
+
+        # Async ingestion: POSTs are buffered in SQS and the greeter applies them in batches,
+        # one EFS write & lock per page for the whole batch instead of one per request
+        if enable_async_ingestion:
+            greeter_ingest_dlq = _sqs.Queue(
+                self,
+                "greeterIngestDlq",
+                retention_period=core.Duration.days(14)
+            )
+            greeter_ingest_queue = _sqs.Queue(
+                self,
+                "greeterIngestQueue",
+                # Lambda recommends 6x the function timeout, so in-flight batches are not redelivered
+                visibility_timeout=core.Duration.seconds(6 * greeter_fn_timeout_secs),
+                dead_letter_queue=_sqs.DeadLetterQueue(
+                    max_receive_count=5,
+                    queue=greeter_ingest_dlq
+                )
+            )
+            greeter_ingest_queue.grant_consume_messages(greeter_fn_dev_alias)
+            greeter_ingest_esm = greeter_fn_dev_alias.add_event_source_mapping(
+                "greeterIngestQueueMapping",
+                event_source_arn=greeter_ingest_queue.queue_arn,
+                batch_size=sqs_batch_size,
+                max_batching_window=core.Duration.seconds(sqs_batch_window_secs)
+            )
+            # Only the records in batchItemFailures go back to the queue. Not modelled in this CDK version
+            greeter_ingest_esm.node.default_child.add_property_override(
+                "FunctionResponseTypes", ["ReportBatchItemFailures"])
+
+            api_sqs_role = _iam.Role(
+                self,
+                "apiSqsRole",
+                assumed_by=_iam.ServicePrincipal("apigateway.amazonaws.com")
+            )
+            greeter_ingest_queue.grant_send_messages(api_sqs_role)
+
 # %%
         wa_api_logs = _logs.LogGroup(
             self,
@@ -136,25 +300,110 @@ class EfsContentCreatorStack(core.Stack):
             endpoint_types=[
                 _apigw.EndpointType.EDGE
             ],
-            description=f"{GlobalArgs.OWNER}: API Best Practices. This stack deploys an API and integrates with Lambda $LATEST alias."
+            # Binary uploads reach the greeter base64 encoded, it decodes them in chunks
+            binary_media_types=["application/octet-stream"],
+            description=f"{GlobalArgs.OWNER}: API Best Practices. This stack deploys an API and integrates with the Lambda MystiqueAutomation alias."
         )
 
         wa_api_res = wa_api.root.add_resource("well-architected-api")
         create_content = wa_api_res.add_resource("create-content")
+        self.create_content_url = create_content.url
+
+        # POSTs go to the greeter, or to the ingest queue with a 202 once SQS has them
+        def _post_integration():
+            if not enable_async_ingestion:
+                return _apigw.LambdaIntegration(
+                    handler=greeter_fn_dev_alias,
+                    proxy=True
+                )
+            return _apigw.AwsIntegration(
+                service="sqs",
+                path=f"{core.Aws.ACCOUNT_ID}/{greeter_ingest_queue.queue_name}",
+                integration_http_method="POST",
+                options=_apigw.IntegrationOptions(
+                    credentials_role=api_sqs_role,
+                    passthrough_behavior=_apigw.PassthroughBehavior.NEVER,
+                    request_parameters={
+                        "integration.request.header.Content-Type": "'application/x-www-form-urlencoded'"
+                    },
+                    request_templates={
+                        content_type: SQS_SEND_MESSAGE_TEMPLATE
+                        for content_type in ["text/plain", "application/json", "application/x-ndjson"]
+                    },
+                    integration_responses=[
+                        _apigw.IntegrationResponse(
+                            status_code="202",
+                            response_templates={
+                                "application/json": SQS_ACCEPTED_TEMPLATE
+                            }
+                        ),
+                        # SQS refused the message, the client has to retry
+                        _apigw.IntegrationResponse(
+                            status_code="500",
+                            selection_pattern="[45]\\d{2}",
+                            response_templates={
+                                "application/json": '{"message": "Message not accepted, retry later"}'
+                            }
+                        )
+                    ]
+                )
+            )
+
+        post_method_options = {}
+        if enable_async_ingestion:
+            post_method_options["method_responses"] = [
+                _apigw.MethodResponse(status_code="202"),
+                _apigw.MethodResponse(status_code="500")
+            ]
 
         # Add POST method to API
         create_content_get = create_content.add_method(
             http_method="POST",
             request_parameters={
                 "method.request.header.InvocationType": True,
+                "method.request.header.X-Content-Key": False,
+                "method.request.header.Idempotency-Key": False,
                 "method.request.path.mystique": True
             },
+            integration=_post_integration(),
+            **post_method_options
+        )
+
+        # Add GET method to API, pollers revalidate with If-None-Match and get a 304 when unchanged
+        create_content_read = create_content.add_method(
+            http_method="GET",
+            request_parameters={
+                "method.request.header.If-None-Match": False,
+                "method.request.querystring.since": False,
+                "method.request.querystring.limit": False
+            },
             integration=_apigw.LambdaIntegration(
-                handler=greeter_fn,
+                handler=greeter_fn_dev_alias,
                 proxy=True
             )
         )
 
+        # Keyed content, each key is written to its own shard file on EFS with its own lock
+        content_shard = create_content.add_resource("{mystique}")
+        content_shard.add_method(
+            http_method="GET",
+            request_parameters={
+                "method.request.path.mystique": True
+            },
+            integration=_apigw.LambdaIntegration(
+                handler=greeter_fn_dev_alias,
+                proxy=True
+            )
+        )
+        content_shard.add_method(
+            http_method="POST",
+            request_parameters={
+                "method.request.path.mystique": True
+            },
+            integration=_post_integration(),
+            **post_method_options
+        )
+
         # Outputs
         output_0 = core.CfnOutput(
             self,
@@ -169,3 +418,39 @@ class EfsContentCreatorStack(core.Stack):
             value=f"curl -X POST -H 'Content-Type: text/plain' -d 'Hello again :)' {create_content.url}",
             description='Use an utility like curl to add content to EFS. For ex: curl -X POST -H "Content-Type: text/plain" -d "Hello again :)" ${API_URL}'
         )
+
+        output_3 = core.CfnOutput(
+            self,
+            "ContentCreatorBatchApiUrl",
+            value=f"curl -X POST -H 'Content-Type: application/json' -d '[\"Hello\", \"again :)\"]' {create_content.url}",
+            description="Send a JSON array (or NDJSON with Content-Type: application/x-ndjson) to add many messages in one request"
+        )
+
+        output_5 = core.CfnOutput(
+            self,
+            "ContentHistoryApiUrl",
+            value=f"curl '{create_content.url}?since=0&limit=50'",
+            description="Page through past messages, pass the returned next_since to get the next page"
+        )
+
+        output_4 = core.CfnOutput(
+            self,
+            "ContentShardApiUrl",
+            value=f"curl -X POST -H 'Content-Type: text/plain' -d 'Hello shard :)' {create_content.url}/my-topic",
+            description="Keyed content is written to shards/<hash>/<key>.html on EFS, shards/index.html links them all"
+        )
+
+        output_2 = core.CfnOutput(
+            self,
+            "ContentReaderApiUrl",
+            value=f"curl -i -H 'If-None-Match: \"<etag>\"' {create_content.url}",
+            description="Use an utility like curl to read the current content, repeat with the returned ETag to get a 304 Not Modified"
+        )
+
+        if enable_async_ingestion:
+            output_6 = core.CfnOutput(
+                self,
+                "ContentIngestQueueUrl",
+                value=f"{greeter_ingest_queue.queue_url}",
+                description="POSTs are buffered here and applied to EFS in batches, failed messages end up in the dead letter queue"
+            )
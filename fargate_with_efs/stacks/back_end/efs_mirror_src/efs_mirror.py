@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Mirror the html published on EFS onto task-local storage, so nginx serves from local disk.
+
+Runs as a sidecar next to nginx. Every poll it stats the directories under
+SOURCE_DIR, not the files. The content creator publishes by renaming a temp file
+over the page (its atomic publish mode), which moves the mtime of the directory.
+Only directories that moved are listed again, and only files whose inode in the
+listing changed are copied into TARGET_DIR. A poll of an unchanged tree costs
+one stat per directory, however many pages the site has. Writes in place do not
+move a directory, they are picked up by the full scan every
+FULL_SCAN_INTERVAL_SECS, which stats every file.
+
+Each copy is written to a temp file next to its target & renamed into place,
+nginx never sees a partial page. Files gone from EFS are removed locally. Dot
+files & directories (journal, idempotency, history, site sources & manifests of
+the content creator) are never mirrored.
+
+EFS sees one reader per task instead of one per request.
+
+    SOURCE_DIR=/efs/html TARGET_DIR=/usr/share/nginx/html python3 efs_mirror.py
+    python3 efs_mirror.py --once     # single pass, e.g. against two local directories
+"""
+import argparse
+import fcntl
+import logging
+import os
+import shutil
+import time
+import uuid
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    ENVIRONMENT = "production"
+    MODULE_NAME = "efs_mirror"
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    SOURCE_DIR = os.getenv("SOURCE_DIR", "/efs/html")
+    TARGET_DIR = os.getenv("TARGET_DIR", "/usr/share/nginx/html")
+    POLL_INTERVAL_SECS = float(os.getenv("POLL_INTERVAL_SECS", 1))
+    # Safety net for writes that do not move a directory mtime, 0 disables it
+    FULL_SCAN_INTERVAL_SECS = float(os.getenv("FULL_SCAN_INTERVAL_SECS", 300))
+    # Written into TARGET_DIR after the first full sync, the container health check waits for it
+    READY_MARKER = ".efs-mirror-ready"
+
+
+def set_logging(lv=GlobalArgs.LOG_LEVEL):
+    """ Helper to enable logging """
+    logging.basicConfig(level=lv)
+    logger = logging.getLogger()
+    logger.setLevel(lv)
+    return logger
+
+
+logger = set_logging()
+
+
+def _stat_key(st):
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _dir_key(st):
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def copy_file(src_path, dst_path):
+    """
+    Copy src_path to dst_path through a temp file & a rename. Holds a shared
+    flock on the source, so in-place writes of the content creator's flock
+    publish mode are never copied half way. Returns the stat key of the source
+    as copied, or None if it changed during the copy.
+    """
+    dst_dir, dst_name = os.path.split(dst_path)
+    os.makedirs(dst_dir, exist_ok=True)
+    tmp_path = os.path.join(dst_dir, f".{dst_name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(src_path, "rb") as src:
+            fcntl.flock(src, fcntl.LOCK_SH)
+            try:
+                before = _stat_key(os.fstat(src.fileno()))
+                with open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                after = _stat_key(os.fstat(src.fileno()))
+            finally:
+                fcntl.flock(src, fcntl.LOCK_UN)
+        if before != after:
+            os.remove(tmp_path)
+            return None
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dst_path)
+        return after
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class EfsMirror:
+    """ Keeps target_dir a copy of the non-dot files of source_dir """
+
+    def __init__(self, source_dir, target_dir, full_scan_interval_secs=GlobalArgs.FULL_SCAN_INTERVAL_SECS):
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.full_scan_interval_secs = full_scan_interval_secs
+        # Stat keys of the source files as last copied
+        self.synced = {}
+        # (inode, mtime) of the source directories as last listed, None lists it again next poll
+        self.dirs = {}
+        self.last_full_scan = None
+
+    def sync_once(self):
+        """ One poll, returns (copied, removed) relative paths """
+        copied, removed = [], []
+        now = time.monotonic()
+        if self.last_full_scan is None or (
+            self.full_scan_interval_secs > 0 and now - self.last_full_scan >= self.full_scan_interval_secs
+        ):
+            self.last_full_scan = now
+            self._sync_dir("", copied, removed, full=True)
+            return copied, removed
+
+        # A rename into or out of a directory moves its mtime, directories that
+        # did not move are not listed & their files are not looked at
+        for rel_dir in sorted(self.dirs):
+            if rel_dir in self.dirs:
+                self._sync_dir(rel_dir, copied, removed)
+        return copied, removed
+
+    def _sync_dir(self, rel_dir, copied, removed, full=False):
+        src_dir = os.path.join(self.source_dir, rel_dir)
+        try:
+            dir_key = _dir_key(os.stat(src_dir))
+            if not full and self.dirs.get(rel_dir) == dir_key:
+                return
+            # Recorded before the listing, a rename during the listing shows up next poll
+            self.dirs[rel_dir] = dir_key
+            with os.scandir(src_dir) as it:
+                entries = [e for e in it if not e.name.startswith(".")]
+        except FileNotFoundError:
+            self._forget(rel_dir, removed)
+            return
+
+        seen = set()
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name)
+            seen.add(rel_path)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if full or rel_path not in self.dirs:
+                        self._sync_dir(rel_path, copied, removed, full)
+                elif entry.is_file(follow_symlinks=False):
+                    self._sync_file(rel_path, entry, copied, full)
+            except FileNotFoundError:
+                # Renamed away after the listing, the next poll sees the directory move again
+                continue
+
+        for rel_path in [p for p in self.synced if os.path.dirname(p) == rel_dir and p not in seen]:
+            self._remove(rel_path, removed)
+        for sub_dir in [d for d in self.dirs if d and os.path.dirname(d) == rel_dir and d not in seen]:
+            self._forget(sub_dir, removed)
+
+    def _sync_file(self, rel_path, entry, copied, full):
+        synced_key = self.synced.get(rel_path)
+        if synced_key is not None:
+            if full:
+                # Full scans stat every file, they also catch in-place writes
+                if _stat_key(os.stat(entry.path)) == synced_key:
+                    return
+            elif entry.inode() == synced_key[0]:
+                # The inode comes with the listing, an atomic publish always brings a new one
+                return
+        copied_key = copy_file(entry.path, os.path.join(self.target_dir, rel_path))
+        if copied_key is None:
+            # Torn copy, changed while it was copied. Listed again next poll.
+            self.dirs[os.path.dirname(rel_path)] = None
+            return
+        self.synced[rel_path] = copied_key
+        copied.append(rel_path)
+
+    def _remove(self, rel_path, removed):
+        try:
+            os.remove(os.path.join(self.target_dir, rel_path))
+        except FileNotFoundError:
+            pass
+        del self.synced[rel_path]
+        removed.append(rel_path)
+
+    def _forget(self, rel_dir, removed):
+        """ rel_dir is gone from the source, drop its local files & its state """
+        prefix = os.path.join(rel_dir, "")
+        for rel_path in [p for p in self.synced if p.startswith(prefix) or not rel_dir]:
+            self._remove(rel_path, removed)
+        for sub_dir in [d for d in self.dirs if d == rel_dir or d.startswith(prefix)]:
+            del self.dirs[sub_dir]
+
+    def mark_ready(self):
+        with open(os.path.join(self.target_dir, GlobalArgs.READY_MARKER), "w") as f:
+            f.write(f"{time.time()}\n")
+
+    def run(self, poll_interval_secs):
+        os.makedirs(self.target_dir, exist_ok=True)
+        copied, _ = self.sync_once()
+        logger.info("initial_sync files:%s", len(copied))
+        self.mark_ready()
+        while True:
+            begin = time.monotonic()
+            try:
+                copied, removed = self.sync_once()
+                if copied or removed:
+                    logger.info("synced copied:%s removed:%s", copied, removed)
+            except OSError:
+                # EFS hiccup, keep serving the last good copy & try again next poll
+                logger.exception("sync_failed")
+            time.sleep(max(0.0, poll_interval_secs - (time.monotonic() - begin)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror EFS html onto local disk for nginx")
+    parser.add_argument("--source-dir", default=GlobalArgs.SOURCE_DIR)
+    parser.add_argument("--target-dir", default=GlobalArgs.TARGET_DIR)
+    parser.add_argument("--poll-interval-secs", type=float, default=GlobalArgs.POLL_INTERVAL_SECS)
+    parser.add_argument("--full-scan-interval-secs", type=float, default=GlobalArgs.FULL_SCAN_INTERVAL_SECS)
+    parser.add_argument("--once", action="store_true", help="Sync once and exit")
+    args = parser.parse_args()
+
+    mirror = EfsMirror(args.source_dir, args.target_dir, args.full_scan_interval_secs)
+    if args.once:
+        os.makedirs(args.target_dir, exist_ok=True)
+        copied, removed = mirror.sync_once()
+        logger.info("synced copied:%s removed:%s", copied, removed)
+        return
+    mirror.run(args.poll_interval_secs)
+
+
+if __name__ == "__main__":
+    main()
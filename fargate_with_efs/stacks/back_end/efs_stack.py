@@ -16,6 +16,47 @@ class GlobalArgs:
     MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
 
 
+# Named EFS performance profiles, selected with the `efs_performance_profile` context.
+# Lifecycle policies apply to the whole filesystem, so the profiles that serve the
+# hot nginx html keep everything in the standard storage class.
+EFS_PERFORMANCE_PROFILES = {
+    "latency-optimised": {
+        "performance_mode": _efs.PerformanceMode.GENERAL_PURPOSE,
+        "throughput_mode": _efs.ThroughputMode.BURSTING,
+        "lifecycle_policy": None
+    },
+    "throughput-optimised": {
+        "performance_mode": _efs.PerformanceMode.GENERAL_PURPOSE,
+        "throughput_mode": _efs.ThroughputMode.PROVISIONED,
+        "lifecycle_policy": None
+    },
+    "cost-optimised": {
+        "performance_mode": _efs.PerformanceMode.GENERAL_PURPOSE,
+        "throughput_mode": _efs.ThroughputMode.BURSTING,
+        "lifecycle_policy": _efs.LifecyclePolicy.AFTER_7_DAYS
+    }
+}
+
+
+def efs_performance_settings(profile: str, provisioned_throughput_mibps: int = None) -> dict:
+    """
+    Resolve a profile name to FileSystem arguments, rejecting combinations EFS would not accept.
+    """
+    if profile not in EFS_PERFORMANCE_PROFILES:
+        raise ValueError(
+            f"Unknown EFS performance profile '{profile}', choose one of {sorted(EFS_PERFORMANCE_PROFILES)}")
+    settings = dict(EFS_PERFORMANCE_PROFILES[profile])
+    if settings["throughput_mode"] == _efs.ThroughputMode.PROVISIONED:
+        if not provisioned_throughput_mibps or provisioned_throughput_mibps < 1:
+            raise ValueError(
+                f"EFS performance profile '{profile}' needs efs_provisioned_throughput_mibps >= 1")
+        settings["provisioned_throughput_per_second"] = core.Size.mebibytes(provisioned_throughput_mibps)
+    elif provisioned_throughput_mibps:
+        raise ValueError(
+            f"efs_provisioned_throughput_mibps is only valid with a provisioned throughput profile, not '{profile}'")
+    return settings
+
+
 class EfsStack(core.Stack):
 
     def __init__(
@@ -23,11 +64,18 @@ class EfsStack(core.Stack):
         scope: core.Construct,
         id: str,
         vpc,
+        vpc_subnets=None,
         efs_mnt_path: str = "/efs",
+        performance_profile: str = "cost-optimised",
+        provisioned_throughput_mibps: int = None,
         **kwargs
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # Fail the synth early on an incompatible profile
+        efs_perf_settings = efs_performance_settings(
+            performance_profile, provisioned_throughput_mibps)
+
         # Create Security Group to connect to EFS
         self.efs_sg = _ec2.SecurityGroup(
             self,
@@ -49,12 +97,11 @@ class EfsStack(core.Stack):
             "elasticFileSystem",
             file_system_name=f"high-performance-storage",
             vpc=vpc,
+            vpc_subnets=vpc_subnets,
             security_group=self.efs_sg,
             encrypted=False,
-            lifecycle_policy=_efs.LifecyclePolicy.AFTER_7_DAYS,
-            performance_mode=_efs.PerformanceMode.GENERAL_PURPOSE,
-            throughput_mode=_efs.ThroughputMode.BURSTING,
-            removal_policy=core.RemovalPolicy.DESTROY
+            removal_policy=core.RemovalPolicy.DESTROY,
+            **efs_perf_settings
         )
 
         # create efs acl
@@ -1,9 +1,15 @@
+from aws_cdk import aws_cloudfront as _cloudfront
 from aws_cdk import aws_ec2 as _ec2
+from aws_cdk import aws_ecr_assets as _ecr_assets
 from aws_cdk import aws_ecs as _ecs
 from aws_cdk import aws_ecs_patterns as _ecs_patterns
 from aws_cdk import aws_logs as _logs
 from aws_cdk import core
 
+from fargate_with_efs.stacks.back_end.nginx_config import render_nginx_conf
+
+import os
+
 
 class GlobalArgs:
     """
@@ -27,7 +33,25 @@ class FargateWithEfsStack(core.Stack):
             custom_vpc,
             efs_share,
             efs_ap_nginx,
+            task_subnets=None,
             enable_container_insights: bool = False,
+            enable_gzip_static: bool = True,
+            task_cpu: int = 256,
+            task_memory_mib: int = 512,
+            min_task_count: int = 1,
+            max_task_count: int = 1,
+            requests_per_target: int = 1000,
+            target_cpu_percent: int = 60,
+            scale_in_cooldown_secs: int = 120,
+            scale_out_cooldown_secs: int = 30,
+            open_file_cache_valid_secs: int = 5,
+            enable_cdn: bool = False,
+            cdn_html_ttl_secs: int = 300,
+            nginx_image: str = "nginx:1.19.2-alpine",
+            build_nginx_image: bool = True,
+            health_check_grace_secs: int = 20,
+            enable_efs_mirror: bool = False,
+            efs_mirror_poll_secs: float = 1,
             ** kwargs
     ) -> None:
         super().__init__(scope, id, **kwargs)
@@ -53,15 +77,15 @@ class FargateWithEfsStack(core.Stack):
             self,
             "fargateClusterId",
             cluster_name=f"web-app-{id}",
-            # container_insights=enable_container_insights,
+            container_insights=enable_container_insights,
             vpc=custom_vpc
         )
 
         web_app_task_def = _ecs.FargateTaskDefinition(
             self,
             "webAppTaskDef",
-            cpu=256,
-            memory_limit_mib=512,
+            cpu=task_cpu,
+            memory_limit_mib=task_memory_mib,
         )
 
         # Add EFS Volume to TaskDef
@@ -76,19 +100,55 @@ class FargateWithEfsStack(core.Stack):
             )
         )
 
+        # nginx.conf tuned for EFS: open_file_cache, sendfile, gzip_static & workers sized to the task
+        nginx_conf = render_nginx_conf(
+            task_cpu=task_cpu,
+            nofile_limit=65536,
+            open_file_cache_valid_secs=open_file_cache_valid_secs,
+            enable_gzip_static=enable_gzip_static
+        )
+        if build_nginx_image:
+            # Pinned base with the config baked in, pushed to the CDK assets ECR repository.
+            # Tasks pull a few MB from ECR instead of nginx:latest from Docker Hub through the NAT.
+            web_app_image_asset = _ecr_assets.DockerImageAsset(
+                self,
+                "webAppImage",
+                directory=os.path.join(os.path.dirname(__file__), "nginx_src"),
+                build_args={
+                    "NGINX_BASE_IMAGE": nginx_image,
+                    "NGINX_CONF": nginx_conf
+                }
+            )
+            web_app_image = _ecs.ContainerImage.from_docker_image_asset(web_app_image_asset)
+            web_app_env = {}
+            nginx_cmd = {}
+        else:
+            web_app_image = _ecs.ContainerImage.from_registry(nginx_image)
+            web_app_env = {"NGINX_CONF": nginx_conf}
+            nginx_cmd = {
+                "entry_point": ["/bin/sh", "-c"],
+                "command": [
+                    'printf "%s" "$NGINX_CONF" > /etc/nginx/nginx.conf && exec nginx -g "daemon off;"'
+                ]
+            }
+
+        # The mirror sidecar gets a small slice of the task, nginx keeps the rest
+        efs_mirror_memory_mib = 64 if enable_efs_mirror else 0
+
         web_app_container = web_app_task_def.add_container(
             "webAppContainer",
-            cpu=256,
-            memory_limit_mib=512,
+            cpu=task_cpu,
+            memory_limit_mib=task_memory_mib - efs_mirror_memory_mib,
             environment={
                 "github": "https://github.com/miztiik",
-                "ko_fi": "https://ko-fi.com/miztiik"
+                "ko_fi": "https://ko-fi.com/miztiik",
+                **web_app_env
             },
-            image=_ecs.ContainerImage.from_registry(
-                "nginx:latest"),
+            image=web_app_image,
             logging=_ecs.LogDrivers.aws_logs(
                 stream_prefix="mystique-automation-logs",
-                log_retention=_logs.RetentionDays.ONE_DAY)
+                log_retention=_logs.RetentionDays.ONE_DAY),
+            **nginx_cmd
         )
 
         web_app_container.add_ulimits(
@@ -112,14 +172,69 @@ class FargateWithEfsStack(core.Stack):
             )
         )
 
-        # Mount EFS Volume to Web Server Container
-        web_app_container.add_mount_points(
-            _ecs.MountPoint(
-                container_path="/usr/share/nginx/html",
-                read_only=False,
-                source_volume="html"
+        if enable_efs_mirror:
+            # The sidecar copies what changed on EFS onto task storage, nginx serves
+            # from local disk & EFS sees a single reader per task
+            web_app_task_def.add_volume(name="html-local")
+
+            efs_mirror_container = web_app_task_def.add_container(
+                "efsMirrorContainer",
+                memory_limit_mib=efs_mirror_memory_mib,
+                environment={
+                    "SOURCE_DIR": "/efs/html",
+                    "TARGET_DIR": "/usr/share/nginx/html",
+                    "POLL_INTERVAL_SECS": f"{efs_mirror_poll_secs}"
+                },
+                image=_ecs.ContainerImage.from_asset(
+                    os.path.join(os.path.dirname(__file__), "efs_mirror_src"),
+                    exclude=["__pycache__", "*.pyc"]),
+                logging=_ecs.LogDrivers.aws_logs(
+                    stream_prefix="mystique-automation-logs",
+                    log_retention=_logs.RetentionDays.ONE_DAY),
+                # Healthy once the first full sync is on local disk
+                health_check=_ecs.HealthCheck(
+                    command=["CMD-SHELL", "test -f /usr/share/nginx/html/.efs-mirror-ready"],
+                    interval=core.Duration.seconds(5),
+                    retries=3,
+                    start_period=core.Duration.seconds(10)
+                )
+            )
+            efs_mirror_container.add_mount_points(
+                _ecs.MountPoint(
+                    container_path="/efs/html",
+                    read_only=True,
+                    source_volume="html"
+                ),
+                _ecs.MountPoint(
+                    container_path="/usr/share/nginx/html",
+                    read_only=False,
+                    source_volume="html-local"
+                )
+            )
+
+            web_app_container.add_mount_points(
+                _ecs.MountPoint(
+                    container_path="/usr/share/nginx/html",
+                    read_only=True,
+                    source_volume="html-local"
+                )
+            )
+            # Do not take traffic with an empty docroot
+            web_app_container.add_container_dependencies(
+                _ecs.ContainerDependency(
+                    container=efs_mirror_container,
+                    condition=_ecs.ContainerDependencyCondition.HEALTHY
+                )
+            )
+        else:
+            # Mount EFS Volume to Web Server Container
+            web_app_container.add_mount_points(
+                _ecs.MountPoint(
+                    container_path="/usr/share/nginx/html",
+                    read_only=False,
+                    source_volume="html"
+                )
             )
-        )
 
         # Launch service and attach load balancer using CDK Pattern
         web_app_service = _ecs_patterns.ApplicationLoadBalancedFargateService(
@@ -131,14 +246,93 @@ class FargateWithEfsStack(core.Stack):
             assign_public_ip=False,
             public_load_balancer=True,
             listener_port=80,
-            desired_count=1,
+            desired_count=min_task_count,
             # enable_ecs_managed_tags=True,
-            health_check_grace_period=core.Duration.seconds(60),
+            # nginx is up within a second of the image landing, no need to wait a minute
+            health_check_grace_period=core.Duration.seconds(health_check_grace_secs),
             # cpu=1024,
             # memory_limit_mib=2048,
             # service_name="chatAppService",
         )
 
+        # Two passing checks 10s apart put a new task in service, instead of the 5 x 30s default
+        web_app_service.target_group.configure_health_check(
+            interval=core.Duration.seconds(10),
+            healthy_threshold_count=2
+        )
+
+        # The pattern in this CDK version always picks the default subnets for tasks
+        if task_subnets is not None:
+            web_app_service.service.node.find_child("Service").add_property_override(
+                "NetworkConfiguration.AwsvpcConfiguration.Subnets",
+                custom_vpc.select_subnets(
+                    subnet_group_name=task_subnets.subnet_group_name,
+                    subnet_type=task_subnets.subnet_type
+                ).subnet_ids
+            )
+
+        # Track ALB requests per task & task CPU, whichever asks for more tasks wins
+        if max_task_count > min_task_count:
+            web_app_scaling = web_app_service.service.auto_scale_task_count(
+                min_capacity=min_task_count,
+                max_capacity=max_task_count
+            )
+            web_app_scaling.scale_on_request_count(
+                "webAppRequestCountScaling",
+                requests_per_target=requests_per_target,
+                target_group=web_app_service.target_group,
+                scale_in_cooldown=core.Duration.seconds(scale_in_cooldown_secs),
+                scale_out_cooldown=core.Duration.seconds(scale_out_cooldown_secs)
+            )
+            web_app_scaling.scale_on_cpu_utilization(
+                "webAppCpuScaling",
+                target_utilization_percent=target_cpu_percent,
+                scale_in_cooldown=core.Duration.seconds(scale_in_cooldown_secs),
+                scale_out_cooldown=core.Duration.seconds(scale_out_cooldown_secs)
+            )
+
+        # Edge cache in front of the ALB, a hit never reaches EFS. The content creator invalidates
+        # the paths it rewrote once a minute, the short TTL bounds staleness if an invalidation is lost
+        self.cdn_distribution_id = ""
+        if enable_cdn:
+            web_app_cdn = _cloudfront.CloudFrontWebDistribution(
+                self,
+                "webAppCdn",
+                comment=f"Edge cache for web-app-{id}",
+                price_class=_cloudfront.PriceClass.PRICE_CLASS_100,
+                viewer_protocol_policy=_cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                origin_configs=[
+                    _cloudfront.SourceConfiguration(
+                        custom_origin_source=_cloudfront.CustomOriginConfig(
+                            domain_name=web_app_service.load_balancer.load_balancer_dns_name,
+                            origin_protocol_policy=_cloudfront.OriginProtocolPolicy.HTTP_ONLY
+                        ),
+                        behaviors=[
+                            _cloudfront.Behavior(
+                                is_default_behavior=True,
+                                compress=True,
+                                min_ttl=core.Duration.seconds(0),
+                                default_ttl=core.Duration.seconds(cdn_html_ttl_secs),
+                                max_ttl=core.Duration.seconds(cdn_html_ttl_secs),
+                                forwarded_values=_cloudfront.CfnDistribution.ForwardedValuesProperty(
+                                    query_string=False
+                                )
+                            )
+                        ]
+                    )
+                ]
+            )
+            self.cdn_distribution_id = web_app_cdn.distribution_id
+
+            output_3 = core.CfnOutput(
+                self,
+                "webAppCdnUrl",
+                value=f"https://{web_app_cdn.domain_name}",
+                description="Cached web server url, pages are invalidated by the content creator on every write."
+            )
+
+        self.web_app_url = f"http://{web_app_service.load_balancer.load_balancer_dns_name}"
+
         # Outputs
         output_0 = core.CfnOutput(
             self,
@@ -156,6 +350,14 @@ class FargateWithEfsStack(core.Stack):
         output_2 = core.CfnOutput(
             self,
             "webAppServiceUrl",
-            value=f"http://{web_app_service.load_balancer.load_balancer_dns_name}",
+            value=self.web_app_url,
             description="Use an utility like curl or an browser to access the web server."
         )
+
+        if build_nginx_image:
+            output_4 = core.CfnOutput(
+                self,
+                "webAppImageUri",
+                value=f"{web_app_image_asset.image_uri}",
+                description="ECR image of the web server, run make nginx_soci_index IMAGE_URI=<this> to let Fargate lazy load it."
+            )
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Small client abstraction over CloudFront invalidations.
+
+The greeter queues the URL paths it publishes on EFS and its scheduled
+housekeeping run hands them over in one batch, so a burst of writes costs one
+CreateInvalidation call per run instead of one per request. Anything with an
+`invalidate(paths)` method can stand in for the CloudFront client, e.g.
+RecordingInvalidator when running locally.
+"""
+import time
+import uuid
+
+# Within the greeter's 15s timeout even when the call & its one retry both time out
+CONNECT_TIMEOUT_SECS = 2
+READ_TIMEOUT_SECS = 4
+RETRY_ATTEMPTS = 1
+
+
+class CloudFrontInvalidator:
+    """ Issues one CreateInvalidation per batch of paths """
+
+    def __init__(self, distribution_id, client=None):
+        self.distribution_id = distribution_id
+        self._client = client
+
+    @property
+    def client(self):
+        # boto3 is heavy to import, only the housekeeping runs that invalidate pay for it
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+            # The boto3 defaults of 60s per connect & read outlast the function timeout
+            self._client = boto3.client("cloudfront", config=Config(
+                connect_timeout=CONNECT_TIMEOUT_SECS,
+                read_timeout=READ_TIMEOUT_SECS,
+                retries={"max_attempts": RETRY_ATTEMPTS}
+            ))
+        return self._client
+
+    def invalidate(self, paths):
+        paths = sorted(set(paths))
+        if not paths:
+            return None
+        resp = self.client.create_invalidation(
+            DistributionId=self.distribution_id,
+            InvalidationBatch={
+                "Paths": {"Quantity": len(paths), "Items": paths},
+                "CallerReference": f"{time.time()}-{uuid.uuid4().hex}"
+            }
+        )
+        return resp["Invalidation"]["Id"]
+
+
+class RecordingInvalidator:
+    """ Local stand-in that remembers every batch instead of calling CloudFront """
+
+    def __init__(self):
+        self.batches = []
+
+    def invalidate(self, paths):
+        paths = sorted(set(paths))
+        if not paths:
+            return None
+        self.batches.append(paths)
+        return f"local-{len(self.batches)}"
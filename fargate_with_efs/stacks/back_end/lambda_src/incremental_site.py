@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental multi-page static site, rendered from the messages written to EFS.
+
+    <root>/index.html              links every topic page
+    <root>/topics/<topic>.html     most recent messages of one topic
+    <root>/feed.xml                most recent messages across all topics
+
+Every page is rendered from one source document kept under <root>/.data. The
+manifest under <root>/.manifest records, for each page, the hash of the source
+it was last rendered from and the hash of the output. A write updates only the
+sources it touches, and only pages whose source hash moved are re-rendered.
+A page is rewritten only when its output really changed, so the cost of a write
+does not depend on how many pages the site has. Pages are rendered & published
+under the lock of their source, so concurrent writers publish in the order they
+updated it and an older render never replaces a newer one.
+"""
+import fcntl
+import hashlib
+import html
+import json
+import os
+import time
+import uuid
+
+
+HTML_HEAD = "<html><head><title>Mystique Automation - {title}</title><style>body{{margin-top:40px;background-color:#333}}</style></head><body><div style=color:white;text-align:center><h1>{title}</h1>"
+HTML_TAIL = "</div></body></html>"
+
+
+def _sha256(data):
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class IncrementalSite:
+    """ Renders the pages that depend on changed sources and nothing else """
+
+    def __init__(self, root, publish, topic_size=50, feed_size=20):
+        """
+        publish(file_path, data) must replace file_path with data atomically,
+        readers (nginx) never lock the pages.
+        """
+        self.root = root
+        self.publish = publish
+        self.topic_size = topic_size
+        self.feed_size = feed_size
+
+    # Sources & the pages that depend on them
+    def _source_path(self, source):
+        digest = _sha256(source)
+        return f"{self.root}/.data/{digest[:2]}/{digest}.json"
+
+    def _page_path(self, source):
+        if source == "topics":
+            return f"{self.root}/index.html"
+        if source == "feed":
+            return f"{self.root}/feed.xml"
+        return f"{self.root}/topics/{source[len('topic:'):]}.html"
+
+    def _manifest_path(self, page_path):
+        digest = _sha256(os.path.relpath(page_path, self.root))
+        return f"{self.root}/.manifest/{digest[:2]}/{digest}.json"
+
+    def _update_source(self, source, update):
+        """
+        Read-modify-write one source document & refresh its page, both under the
+        source's lock. Returns True if the page was rewritten.
+        """
+        path = self._source_path(source)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                doc = json.loads(raw) if raw else None
+                new_doc = update(doc)
+                new_raw = json.dumps(new_doc, sort_keys=True)
+                if new_raw != raw:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(new_raw)
+                    f.flush()
+                return self._refresh_page(source, _sha256(new_raw), new_doc)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_manifest(self, page_path):
+        try:
+            with open(self._manifest_path(page_path), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, page_path, entry):
+        path = self._manifest_path(page_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    # Renderers, one per page kind
+    def _render_topic(self, topic, doc):
+        body = "".join(
+            f"<p>{html.escape(m['message'])}</p>" for m in reversed(doc["messages"])
+        )
+        return HTML_HEAD.format(title=html.escape(topic)) + '<p><a style=color:white href="../index.html">All topics</a></p>' + body + HTML_TAIL
+
+    def _render_index(self, doc):
+        links = "".join(
+            f'<p><a style=color:white href="topics/{t}.html">{html.escape(t)}</a></p>' for t in doc["topics"]
+        )
+        return HTML_HEAD.format(title="Topics") + links + '<p><a style=color:white href="feed.xml">Feed</a></p>' + HTML_TAIL
+
+    def _render_feed(self, doc):
+        items = "".join(
+            "<item>"
+            f"<title>{html.escape(m['topic'])}</title>"
+            f"<link>topics/{m['topic']}.html</link>"
+            f"<description>{html.escape(m['message'])}</description>"
+            f"<pubDate>{time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(m['ts']))}</pubDate>"
+            "</item>"
+            for m in reversed(doc["messages"])
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            "<title>Mystique Automation</title><link>index.html</link><description>Latest messages</description>"
+            f"{items}</channel></rss>"
+        )
+
+    def _render(self, source, doc):
+        if source == "topics":
+            return self._render_index(doc)
+        if source == "feed":
+            return self._render_feed(doc)
+        return self._render_topic(source[len("topic:"):], doc)
+
+    def _refresh_page(self, source, source_hash, doc):
+        """ Re-render the page of source if the source moved on, write it only if the output changed """
+        page_path = self._page_path(source)
+        entry = self._read_manifest(page_path)
+        if entry.get("source_hash") == source_hash:
+            return False
+        content = self._render(source, doc)
+        content_hash = _sha256(content)
+        written = entry.get("content_hash") != content_hash
+        if written:
+            os.makedirs(os.path.dirname(page_path), exist_ok=True)
+            self.publish(page_path, content.encode("utf-8"))
+        self._write_manifest(page_path, {
+            "source": source,
+            "source_hash": source_hash,
+            "content_hash": content_hash
+        })
+        return written
+
+    def add_messages(self, topic, msgs):
+        """ Apply msgs to topic, returns the pages that were rewritten """
+        now = time.time()
+        new_entries = [{"topic": topic, "message": m, "ts": now} for m in msgs]
+
+        def _append(limit):
+            def _update(doc):
+                messages = (doc or {"messages": []})["messages"] + new_entries
+                return {"messages": messages[-limit:]}
+            return _update
+
+        def _add_topic(doc):
+            topics = set((doc or {"topics": []})["topics"])
+            topics.add(topic)
+            return {"topics": sorted(topics)}
+
+        updates = [
+            (f"topic:{topic}", _append(self.topic_size)),
+            ("feed", _append(self.feed_size))
+        ]
+        # The index only lists topic names, it moves only when a new topic appears.
+        # Checked first, the topic page exists once its source has been updated.
+        if not os.path.exists(self._page_path(f"topic:{topic}")):
+            updates.append(("topics", _add_topic))
+
+        rewritten = []
+        for source, update in updates:
+            if self._update_source(source, update):
+                rewritten.append(self._page_path(source))
+        return rewritten
@@ -3,10 +3,13 @@ import datetime
 import json
 import logging
 import os
-import random
+import struct
 import time
 import fcntl
 
+# random, hashlib, uuid, base64, mmap, zlib & incremental_site are imported where
+# they are used, they are off the POST hot path and would otherwise add to every cold start
+
 
 class GlobalArgs:
     """ Global statics """
@@ -18,6 +21,55 @@ class GlobalArgs:
     RANDOM_SLEEP_SECS = int(os.getenv("RANDOM_SLEEP_SECS", 2))
     ANDON_CORD_PULLED = os.getenv("ANDON_CORD_PULLED", False)
     EFS_MNT_PATH = os.getenv("EFS_MNT_PATH", None)
+    # "direct" rewrites index.html on every POST, "journal" appends to segment files
+    WRITE_MODE = os.getenv("WRITE_MODE", "direct").lower()
+    INDEX_FILE_PATH = f"{EFS_MNT_PATH}/index.html"
+    SHARDS_DIR = f"{EFS_MNT_PATH}/shards"
+    # Keep shards/index.html linking every shard, rewritten only when a new shard appears
+    SHARD_INDEX_ENABLED = os.getenv("SHARD_INDEX_ENABLED", "True").lower() == "true"
+    READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", 64))
+    # Replay responses for repeated Idempotency-Key headers & skip rewrites of identical content
+    IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "True").lower() == "true"
+    IDEMPOTENCY_DIR = os.getenv("IDEMPOTENCY_DIR", f"{EFS_MNT_PATH}/.idempotency")
+    IDEMPOTENCY_TTL_SECS = int(os.getenv("IDEMPOTENCY_TTL_SECS", 300))
+    # Fixed-capacity ring of past messages, served by GET ?since=<seq>&limit=<n>
+    HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "False").lower() == "true"
+    HISTORY_FILE_PATH = os.getenv("HISTORY_FILE_PATH", f"{EFS_MNT_PATH}/.history/ring.dat")
+    HISTORY_CAPACITY = int(os.getenv("HISTORY_CAPACITY", 4096))
+    HISTORY_RECORD_BYTES = int(os.getenv("HISTORY_RECORD_BYTES", 1024))
+    HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", 500))
+    # Multi-page site (topic pages, index & feed) rendered incrementally under SITE_ROOT
+    SITE_ENABLED = os.getenv("SITE_ENABLED", "False").lower() == "true"
+    SITE_ROOT = os.getenv("SITE_ROOT", f"{EFS_MNT_PATH}/site")
+    SITE_DEFAULT_TOPIC = os.getenv("SITE_DEFAULT_TOPIC", "general")
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "MystiqueAutomation/Greeter")
+    # Fraction of invocations that log the raw event, payloads are not logged by default
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0))
+    JOURNAL_DIR = os.getenv("JOURNAL_DIR", f"{EFS_MNT_PATH}/.journal")
+    CHECKPOINT_PATH = f"{JOURNAL_DIR}/checkpoint"
+    JOURNAL_SEGMENT_MAX_BYTES = int(os.getenv("JOURNAL_SEGMENT_MAX_BYTES", 1048576))
+    JOURNAL_COMPACT_INTERVAL_SECS = float(os.getenv("JOURNAL_COMPACT_INTERVAL_SECS", 5))
+    JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", 65536))
+    # "flock" truncates index.html under an exclusive lock, "atomic" renames a temp file over it
+    PUBLISH_MODE = os.getenv("PUBLISH_MODE", "flock").lower()
+    # Precompressed index.html.gz for nginx gzip_static, level 0 disables it
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+    CACHE_MAX_AGE_SECS = int(os.getenv("CACHE_MAX_AGE_SECS", 5))
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 100))
+    MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", 6291456))
+    # Bodies at least this large are streamed to EFS instead of rendered in memory
+    STREAM_MIN_BYTES = int(os.getenv("STREAM_MIN_BYTES", 262144))
+    # Multiple of 4, so every slice of a base64 body decodes on its own
+    STREAM_CHUNK_CHARS = 65536
+    # Streamed messages reach the history & the site as an excerpt of this many characters
+    STREAM_EXCERPT_CHARS = int(os.getenv("STREAM_EXCERPT_CHARS", 1024))
+    # Empty disables invalidations, e.g. when the site is served straight from the ALB
+    CDN_DISTRIBUTION_ID = os.getenv("CDN_DISTRIBUTION_ID", "")
+    # A batch with more paths than this is collapsed into a single /* wildcard
+    CDN_MAX_PATHS = int(os.getenv("CDN_MAX_PATHS", 15))
+    # Paths published since the last housekeeping run, invalidated together by the next one
+    CDN_PENDING_PATH = os.getenv("CDN_PENDING_PATH", f"{EFS_MNT_PATH}/.cdn/pending")
 
 
 def set_logging(lv=GlobalArgs.LOG_LEVEL):
@@ -31,57 +83,979 @@ def set_logging(lv=GlobalArgs.LOG_LEVEL):
 # Initial some defaults in global context to reduce lambda start time, when re-using container
 logger = set_logging()
 
+# Survives across warm invocations, validated against os.stat before every use
+# file_path -> {"key": (inode, size, mtime_ns), "content": str, "etag": str}
+READ_CACHE = {}
+
+SHARD_KEY_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_")
+
+# Built on first use & re-used by warm invocations
+SITE = None
+
+# Timing spans of the current invocation, in milliseconds
+METRICS = {"operation": None, "timings": {}}
+
+# Where the EMF line goes, stdout is picked up by CloudWatch Logs. Swap it for
+# something like a list's append to collect the metrics locally.
+METRICS_SINK = print
+
+# URL paths published during the current invocation, queued for the next CDN invalidation
+PUBLISHED_PATHS = set()
+
+# Built on first use from CDN_DISTRIBUTION_ID. Swap it for a
+# cdn_invalidator.RecordingInvalidator to collect the batches locally.
+CDN_INVALIDATOR = None
+
+# Journal records are prefixed with their payload length as a 4 byte unsigned int
+RECORD_HDR = struct.Struct(">I")
+
+# History ring file: header of magic, capacity, record size & next sequence number,
+# followed by capacity fixed-size slots of (seq, ts, message length, message bytes)
+RING_MAGIC = b"GRNG"
+RING_HDR = struct.Struct(">4sIIQ")
+RING_HDR_BYTES = 64
+RING_REC_HDR = struct.Struct(">QdI")
+
+
+class Span:
+    """ Adds the elapsed milliseconds of the with block to the named timing """
+    __slots__ = ("name", "begin")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+
+    def __exit__(self, *exc):
+        timings = METRICS["timings"]
+        timings[self.name] = timings.get(self.name, 0.0) + (time.perf_counter() - self.begin) * 1000
+
+
+def _lock(f, operation):
+    """ flock that records how long it waited for the lock """
+    with Span("LockWait"):
+        fcntl.flock(f, operation)
+
+
+def emit_metrics(function_version):
+    """ Emit this invocation's timings as one CloudWatch Embedded Metric Format line """
+    if not GlobalArgs.METRICS_ENABLED:
+        return
+    timings = METRICS["timings"]
+    names = sorted(timings)
+    METRICS_SINK(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": GlobalArgs.METRICS_NAMESPACE,
+                "Dimensions": [["FunctionVersion", "Operation"]],
+                "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in names]
+            }]
+        },
+        "FunctionVersion": function_version,
+        "Operation": METRICS["operation"] or "Unknown",
+        **{name: round(timings[name], 3) for name in names}
+    }, separators=(",", ":")))
+
+
+def _note_published(file_path):
+    """ Remember the URL path nginx serves file_path under, for the CDN invalidation """
+    if not (GlobalArgs.CDN_DISTRIBUTION_ID or CDN_INVALIDATOR):
+        return
+    url_path = "/" + os.path.relpath(file_path, GlobalArgs.EFS_MNT_PATH)
+    # Dot files are never served & the .gz is served under the url of the page
+    if "/." in url_path or url_path.endswith(".gz"):
+        return
+    PUBLISHED_PATHS.add(url_path)
+    if url_path.endswith("/index.html"):
+        PUBLISHED_PATHS.add(url_path[:-len("index.html")])
+
+
+def _append_pending_paths(paths):
+    """ Append paths to the pending file, one per line, under an exclusive lock """
+    data = "".join(f"{p}\n" for p in paths).encode("utf-8")
+    path = GlobalArgs.CDN_PENDING_PATH
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        # Appends from different NFS clients are not atomic without the lock
+        _lock(fd, fcntl.LOCK_EX)
+        os.write(fd, data)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def queue_invalidations():
+    """ Hand the paths published by this invocation to the next housekeeping run, no CDN call per request """
+    if not PUBLISHED_PATHS:
+        return
+    paths = sorted(PUBLISHED_PATHS)
+    PUBLISHED_PATHS.clear()
+    try:
+        _append_pending_paths(paths)
+    except OSError:
+        # The content is on EFS already, the edge catches up once its TTL expires
+        logger.exception("cdn_queue_failed paths:%s", paths)
+
+
+def flush_invalidations():
+    """
+    Invalidate every path queued since the last run with a single CDN call, so a
+    burst of writes costs one invalidation per housekeeping run. Paths of a
+    failed call are queued again for the next run.
+    Returns the invalidation id, or None if nothing was invalidated.
+    """
+    global CDN_INVALIDATOR
+    try:
+        pending = open(GlobalArgs.CDN_PENDING_PATH, "r+")
+    except FileNotFoundError:
+        return None
+    with pending:
+        _lock(pending, fcntl.LOCK_EX)
+        try:
+            paths = sorted(set(pending.read().splitlines()) - {""})
+            pending.seek(0)
+            pending.truncate()
+        finally:
+            # Not held across the CDN call, writers keep appending meanwhile
+            fcntl.flock(pending, fcntl.LOCK_UN)
+    if not paths:
+        return None
+    if len(paths) > GlobalArgs.CDN_MAX_PATHS:
+        paths = ["/*"]
+    try:
+        if CDN_INVALIDATOR is None:
+            from cdn_invalidator import CloudFrontInvalidator
+            CDN_INVALIDATOR = CloudFrontInvalidator(GlobalArgs.CDN_DISTRIBUTION_ID)
+        with Span("CdnInvalidate"):
+            invalidation_id = CDN_INVALIDATOR.invalidate(paths)
+        logger.info("cdn_invalidation:%s paths:%s", invalidation_id, paths)
+        return invalidation_id
+    except Exception:
+        logger.exception("cdn_invalidation_failed, requeued paths:%s", paths)
+        _append_pending_paths(paths)
+        return None
+
+
+def _payload_sampled():
+    if GlobalArgs.LOG_PAYLOAD_SAMPLE_RATE <= 0:
+        return False
+    import random
+    return random.random() < GlobalArgs.LOG_PAYLOAD_SAMPLE_RATE
+
 
 def random_sleep(max_seconds=10):
+    import random
     if bool(random.getrandbits(1)):
         logger.info(f"sleep_start_time:{str(datetime.datetime.now())}")
         time.sleep(random.randint(0, max_seconds))
         logger.info(f"sleep_end_time:{str(datetime.datetime.now())}")
 
 
-def get_messages():
+def _stat_key(st):
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _cache_content(file_path, st, content):
+    """ Remember what file_path holds for as long as its inode, size & mtime stay the same """
+    if file_path not in READ_CACHE and len(READ_CACHE) >= GlobalArgs.READ_CACHE_MAX_ENTRIES:
+        READ_CACHE.pop(next(iter(READ_CACHE)))
+    READ_CACHE[file_path] = {"key": _stat_key(st), "content": content, "etag": None}
+
+
+def content_etag(content, file_path=None):
+    """ Strong ETag of the content, hashed only once per cached version """
+    import hashlib
+    entry = READ_CACHE.get(file_path or GlobalArgs.INDEX_FILE_PATH)
+    if entry and entry["content"] is content and entry["etag"] is not None:
+        return entry["etag"]
+    etag = f'"{hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]}"'
+    if entry and entry["content"] is content:
+        entry["etag"] = etag
+    return etag
+
+
+def get_messages(file_path=None):
     try:
-        MSG_FILE_PATH = f"{GlobalArgs.EFS_MNT_PATH}/index.html"
+        MSG_FILE_PATH = file_path or GlobalArgs.INDEX_FILE_PATH
+        # A stat is one round trip, an open + flock + read is several
+        entry = READ_CACHE.get(MSG_FILE_PATH)
+        if entry and _stat_key(os.stat(MSG_FILE_PATH)) == entry["key"]:
+            return entry["content"]
         with open(MSG_FILE_PATH, "r") as msg_file:
-            fcntl.flock(msg_file, fcntl.LOCK_SH)
-            msg = msg_file.read()
-            fcntl.flock(msg_file, fcntl.LOCK_UN)
-            logger.info(f"msg:\n{msg}")
+            # Renamed files are always complete, readers need no lock
+            if GlobalArgs.PUBLISH_MODE != "atomic":
+                _lock(msg_file, fcntl.LOCK_SH)
+            with Span("ReadBack"):
+                msg = msg_file.read()
+            st = os.fstat(msg_file.fileno())
+            if GlobalArgs.PUBLISH_MODE != "atomic":
+                fcntl.flock(msg_file, fcntl.LOCK_UN)
+            _cache_content(MSG_FILE_PATH, st, msg)
+            logger.debug("msg:\n%s", msg)
     except:
         msg = "No message yet."
     return msg
 
 
-def add_message(_msg):
-    if _msg:
-        MSG_FILE_PATH = f"{GlobalArgs.EFS_MNT_PATH}/index.html"
-        # html_content_01 = "<html><head><title>Mystique Automation</title></head><body><h1>"
-        html_content_01 = "<html><head><title>Mystique Automation - Modern Web App</title><style>body{margin-top:40px;background-color:#333}</style></head><body><div style=color:white;text-align:center><h1>Modern Web App</h1><h2>Congratulations!</h2>"
-        html_content_02 = f"<p>{_msg}</p>"
-        # html_content_03 = "</h1></body></html>"
-        html_content_03 = "</div></body></html>"
-        html_content = html_content_01 + html_content_02 + html_content_03
+# html_content_01 = "<html><head><title>Mystique Automation</title></head><body><h1>"
+HTML_HEAD = "<html><head><title>Mystique Automation - Modern Web App</title><style>body{margin-top:40px;background-color:#333}</style></head><body><div style=color:white;text-align:center><h1>Modern Web App</h1><h2>Congratulations!</h2>"
+# html_content_03 = "</h1></body></html>"
+HTML_TAIL = "</div></body></html>"
+
+
+def render_html(msgs):
+    html_content_02 = "".join(f"<p>{_msg}</p>" for _msg in msgs)
+    return HTML_HEAD + html_content_02 + HTML_TAIL
+
+
+def atomic_publish(file_path, data):
+    """
+    Write data (bytes, or an iterable of byte chunks) to a uniquely named temp file
+    next to file_path, fsync it and rename it over file_path. Readers see either
+    the old or the new file, never a partial one.
+    Returns the stat of the published file.
+    """
+    import uuid
+    dir_name, base_name = os.path.split(file_path)
+    tmp_path = f"{dir_name}/.{base_name}.{uuid.uuid4().hex}.tmp"
+    chunks = [data] if isinstance(data, bytes) else data
+    try:
+        with open(tmp_path, "wb") as tmp_file:
+            with Span("Write"):
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+                tmp_file.flush()
+            with Span("Fsync"):
+                os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)
+        st = os.stat(tmp_path)
+        os.replace(tmp_path, file_path)
+        _note_published(file_path)
+        return st
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
+def publish_gzip(file_path, data):
+    """ Compress once per write, so nginx never has to compress per request """
+    # Always renamed into place, a torn .gz would be served as-is by gzip_static
+    atomic_publish(f"{file_path}.gz", _gzip_chunks([data], GlobalArgs.GZIP_LEVEL))
+
+
+def _gzip_chunks(chunks, level):
+    """ Compress a stream of chunks without holding the whole payload """
+    import zlib
+    # wbits=31 emits a gzip container with a zero mtime, like gzip.compress(mtime=0)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _body_chunks(body, is_base64):
+    step = GlobalArgs.STREAM_CHUNK_CHARS
+    if is_base64:
+        import base64
+    for i in range(0, len(body), step):
+        chunk = body[i:i + step]
+        yield base64.b64decode(chunk) if is_base64 else chunk.encode("utf-8")
+
+
+def _message_chunks(body, is_base64):
+    yield f"{HTML_HEAD}<p>".encode("utf-8")
+    yield from _body_chunks(body, is_base64)
+    yield f"</p>{HTML_TAIL}".encode("utf-8")
+
+
+def stream_message(body, is_base64=False, file_path=None):
+    """
+    Publish a single large message without building the page in memory.
+    Header, body & footer are written in fixed-size chunks, so peak memory
+    stays flat no matter how large the payload is.
+    """
+    MSG_FILE_PATH = file_path or GlobalArgs.INDEX_FILE_PATH
+    if GlobalArgs.IDEMPOTENCY_ENABLED:
+        # Streamed pages are not digested, a later publish must not be skipped on a stale record
+        _forget_content_digest(MSG_FILE_PATH)
+    if GlobalArgs.PUBLISH_MODE == "atomic":
+        atomic_publish(MSG_FILE_PATH, _message_chunks(body, is_base64))
+    else:
+        with open(MSG_FILE_PATH, "wb") as msg_file:
+            _lock(msg_file, fcntl.LOCK_EX)
+            with Span("Write"):
+                for chunk in _message_chunks(body, is_base64):
+                    msg_file.write(chunk)
+                msg_file.flush()
+            fcntl.flock(msg_file, fcntl.LOCK_UN)
+        _note_published(MSG_FILE_PATH)
+    if GlobalArgs.GZIP_LEVEL > 0:
+        atomic_publish(
+            f"{MSG_FILE_PATH}.gz",
+            _gzip_chunks(_message_chunks(body, is_base64), GlobalArgs.GZIP_LEVEL)
+        )
+    # Too large to keep around, the next read goes back to EFS
+    READ_CACHE.pop(MSG_FILE_PATH, None)
+
+
+def _sha256(text):
+    import hashlib
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _idempotency_path(kind, name):
+    digest = _sha256(name)
+    return f"{GlobalArgs.IDEMPOTENCY_DIR}/{kind}/{digest[:2]}/{digest}.json"
+
+
+def _write_small(file_path, data):
+    """ Rename a small record into place, no fsync as losing one only costs a rewrite """
+    import uuid
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        f = open(tmp_path, "w")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        f = open(tmp_path, "w")
+    with f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def _read_small(file_path):
+    try:
+        with open(file_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _content_digest_matches(file_path, digest):
+    """
+    True if the last publish to file_path had this digest and nobody has replaced
+    the file since, i.e. its inode, size & mtime are still the ones recorded.
+    """
+    record = _read_small(_idempotency_path("content", file_path))
+    if not record or record.get("digest") != digest:
+        return False
+    try:
+        return list(_stat_key(os.stat(file_path))) == record.get("key")
+    except OSError:
+        return False
+
+
+def _record_content_digest(file_path, digest, st):
+    _write_small(
+        _idempotency_path("content", file_path),
+        json.dumps({"digest": digest, "key": list(_stat_key(st)), "ts": time.time()})
+    )
+
+
+def _forget_content_digest(file_path):
+    try:
+        os.remove(_idempotency_path("content", file_path))
+    except OSError:
+        pass
+
+
+def lookup_request(request_id):
+    """ Response stored for request_id, if it has not outlived IDEMPOTENCY_TTL_SECS """
+    record_path = _idempotency_path("requests", request_id)
+    record = _read_small(record_path)
+    if not record:
+        return None
+    if time.time() - record.get("ts", 0) > GlobalArgs.IDEMPOTENCY_TTL_SECS:
+        try:
+            os.remove(record_path)
+        except OSError:
+            pass
+        return None
+    return record.get("response")
+
+
+def store_request(request_id, response):
+    _write_small(
+        _idempotency_path("requests", request_id),
+        json.dumps({"ts": time.time(), "response": response})
+    )
+
+
+def sweep_idempotency():
+    """ Evict request records older than IDEMPOTENCY_TTL_SECS """
+    requests_dir = f"{GlobalArgs.IDEMPOTENCY_DIR}/requests"
+    expiry = time.time() - GlobalArgs.IDEMPOTENCY_TTL_SECS
+    evicted = 0
+    for dir_path, _, file_names in os.walk(requests_dir):
+        for file_name in file_names:
+            record_path = f"{dir_path}/{file_name}"
+            try:
+                if os.stat(record_path).st_mtime < expiry:
+                    os.remove(record_path)
+                    evicted += 1
+            except OSError:
+                pass
+    logger.info(f"idempotency_records_evicted:{evicted}")
+    return evicted
+
+
+def publish_html(html_content, file_path=None):
+    """ Returns False if file_path already held html_content and nothing was rewritten """
+    MSG_FILE_PATH = file_path or GlobalArgs.INDEX_FILE_PATH
+    digest = _sha256(html_content) if GlobalArgs.IDEMPOTENCY_ENABLED else None
+    # Only the digest record on EFS decides, a stat alone may be answered from the NFS attribute cache
+    if digest and _content_digest_matches(MSG_FILE_PATH, digest):
+        # Byte-identical content, skip the exclusive lock & the rewrite nginx would re-read
+        if GlobalArgs.GZIP_LEVEL > 0 and not os.path.exists(f"{MSG_FILE_PATH}.gz"):
+            publish_gzip(MSG_FILE_PATH, html_content.encode("utf-8"))
+        return False
+    if GlobalArgs.PUBLISH_MODE == "atomic":
+        st = atomic_publish(MSG_FILE_PATH, html_content.encode("utf-8"))
+    else:
         # with open(MSG_FILE_PATH, "a") as msg_file:
         with open(MSG_FILE_PATH, "w") as msg_file:
-            fcntl.flock(msg_file, fcntl.LOCK_EX)
-            msg_file.write(html_content)
+            _lock(msg_file, fcntl.LOCK_EX)
+            with Span("Write"):
+                msg_file.write(html_content)
+                msg_file.flush()
+            st = os.fstat(msg_file.fileno())
             fcntl.flock(msg_file, fcntl.LOCK_UN)
+        _note_published(MSG_FILE_PATH)
+    if GlobalArgs.GZIP_LEVEL > 0:
+        publish_gzip(MSG_FILE_PATH, html_content.encode("utf-8"))
+    # Serve the read-after-write from the bytes we just wrote
+    _cache_content(MSG_FILE_PATH, st, html_content)
+    if digest:
+        _record_content_digest(MSG_FILE_PATH, digest, st)
+    return True
 
 
-def lambda_handler(event, context):
-    logger.info(f"rcvd_evnt:\n{event}")
+def shard_path(key):
+    """ Each key gets its own file, and so its own lock, under a hashed subdirectory """
+    import hashlib
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{GlobalArgs.SHARDS_DIR}/{digest[:2]}/{key}.html"
+
+
+def _register_shard(key):
+    """ Append key to the shard manifest and re-render shards/index.html from it """
+    manifest_path = f"{GlobalArgs.SHARDS_DIR}/keys"
+    with open(manifest_path, "a+") as manifest:
+        _lock(manifest, fcntl.LOCK_EX)
+        manifest.write(f"{key}\n")
+        manifest.flush()
+        manifest.seek(0)
+        keys = sorted(set(manifest.read().split()))
+        fcntl.flock(manifest, fcntl.LOCK_UN)
+    links = "".join(
+        f'<p><a style=color:white href="{os.path.relpath(shard_path(k), GlobalArgs.SHARDS_DIR)}">{k}</a></p>' for k in keys
+    )
+    atomic_publish(f"{GlobalArgs.SHARDS_DIR}/index.html", (HTML_HEAD + links + HTML_TAIL).encode("utf-8"))
+
+
+def prepare_shard(key):
+    """ Returns the shard file for key, creating its directory & index entry on first use """
+    file_path = shard_path(key)
+    if not os.path.exists(file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if GlobalArgs.SHARD_INDEX_ENABLED:
+            _register_shard(key)
+    return file_path
+
+
+def _segment_path(seg_id):
+    return f"{GlobalArgs.JOURNAL_DIR}/segment-{seg_id:012d}.log"
+
+
+def _list_segments():
+    try:
+        names = os.listdir(GlobalArgs.JOURNAL_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        int(n[8:-4]) for n in names if n.startswith("segment-") and n.endswith(".log")
+    )
+
+
+def _read_checkpoint():
+    try:
+        with open(GlobalArgs.CHECKPOINT_PATH, "r") as f:
+            ckpt = json.load(f)
+        return ckpt["segment"], ckpt["offset"], ckpt["ts"]
+    except (OSError, ValueError, KeyError):
+        return 0, 0, 0.0
+
+
+def _write_checkpoint(seg_id, offset):
+    ckpt_path = GlobalArgs.CHECKPOINT_PATH
+    with open(f"{ckpt_path}.tmp", "w") as f:
+        json.dump({"segment": seg_id, "offset": offset, "ts": time.time()}, f)
+    os.replace(f"{ckpt_path}.tmp", ckpt_path)
+
+
+def append_to_journal(msgs):
+    """
+    Append one length prefixed record holding msgs to the active journal segment.
+    The exclusive lock is held only for the append, so its cost is O(message)
+    Returns the segment id and the offset just past the new record.
+    """
+    payload = json.dumps({"ts": time.time(), "msgs": msgs}).encode("utf-8")
+    record = RECORD_HDR.pack(len(payload)) + payload
+    os.makedirs(GlobalArgs.JOURNAL_DIR, exist_ok=True)
+
+    segments = _list_segments()
+    seg_id = segments[-1] if segments else 0
+    create = not segments
+    while True:
+        flags = os.O_WRONLY | os.O_APPEND | (os.O_CREAT if create else 0)
+        try:
+            fd = os.open(_segment_path(seg_id), flags, 0o644)
+        except FileNotFoundError:
+            # Segment was compacted away after we listed; start from the newest one
+            segments = _list_segments()
+            seg_id = segments[-1] if segments else seg_id + 1
+            create = not segments
+            continue
+        try:
+            _lock(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            if size >= GlobalArgs.JOURNAL_SEGMENT_MAX_BYTES:
+                # Sealed segment, roll over to the next one
+                seg_id += 1
+                create = True
+                continue
+            with Span("Write"):
+                os.write(fd, record)
+            return seg_id, size + len(record)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def _read_records(seg_id, offset):
+    """ Yield (payload, end_offset) of every complete record from offset onwards """
+    with open(_segment_path(seg_id), "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    pos = 0
+    while pos + RECORD_HDR.size <= len(data):
+        (length,) = RECORD_HDR.unpack_from(data, pos)
+        end = pos + RECORD_HDR.size + length
+        if end > len(data):
+            # Torn tail, a writer is still appending to it
+            break
+        yield json.loads(data[pos + RECORD_HDR.size:end]), offset + end
+        pos = end
+
+
+def compact_journal():
+    """
+    Render the newest journal record into index.html and drop sealed segments.
+    Only one invocation compacts at a time, the others skip instead of waiting.
+    """
+    os.makedirs(GlobalArgs.JOURNAL_DIR, exist_ok=True)
+    with open(f"{GlobalArgs.JOURNAL_DIR}/compact.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            ckpt_seg, ckpt_offset, _ = _read_checkpoint()
+            segments = [s for s in _list_segments() if s >= ckpt_seg]
+            latest = None
+            for seg_id in segments:
+                offset = ckpt_offset if seg_id == ckpt_seg else 0
+                for record, end in _read_records(seg_id, offset):
+                    latest = record
+                    ckpt_seg, ckpt_offset = seg_id, end
+            if latest is not None:
+                publish_html(render_html(latest["msgs"]))
+            _write_checkpoint(ckpt_seg, ckpt_offset)
+
+            # The newest segment is never removed, so segment ids stay monotonic
+            for seg_id in _list_segments()[:-1]:
+                if seg_id < ckpt_seg:
+                    os.remove(_segment_path(seg_id))
+            logger.info(f"journal_compacted_upto:{ckpt_seg}:{ckpt_offset}")
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def maybe_compact_journal(seg_id, end_offset):
+    ckpt_seg, ckpt_offset, ckpt_ts = _read_checkpoint()
+    if seg_id == ckpt_seg:
+        pending = end_offset - ckpt_offset
+    else:
+        pending = GlobalArgs.JOURNAL_COMPACT_BYTES
+    if (
+        pending >= GlobalArgs.JOURNAL_COMPACT_BYTES
+        or time.time() - ckpt_ts >= GlobalArgs.JOURNAL_COMPACT_INTERVAL_SECS
+    ):
+        compact_journal()
+
+
+def _ring_slot_offset(seq, capacity, record_bytes):
+    return RING_HDR_BYTES + ((seq - 1) % capacity) * record_bytes
+
+
+def append_to_history(msgs):
+    """
+    Write msgs into the next slots of the history ring under one lock.
+    Slots are addressed by sequence number, so the file never grows past its capacity.
+    """
+    import mmap
+    path = GlobalArgs.HISTORY_FILE_PATH
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _lock(fd, fcntl.LOCK_EX)
+        if os.fstat(fd).st_size < RING_HDR_BYTES:
+            # First writer sizes the file & stamps the header, later writers use the header's geometry
+            capacity, record_bytes = GlobalArgs.HISTORY_CAPACITY, GlobalArgs.HISTORY_RECORD_BYTES
+            os.ftruncate(fd, RING_HDR_BYTES + capacity * record_bytes)
+            os.pwrite(fd, RING_HDR.pack(RING_MAGIC, capacity, record_bytes, 1), 0)
+        with mmap.mmap(fd, 0) as ring:
+            _, capacity, record_bytes, next_seq = RING_HDR.unpack_from(ring, 0)
+            max_payload = record_bytes - RING_REC_HDR.size
+            now = time.time()
+            with Span("Write"):
+                for _msg in msgs:
+                    data = _msg.encode("utf-8")
+                    offset = _ring_slot_offset(next_seq, capacity, record_bytes)
+                    RING_REC_HDR.pack_into(ring, offset, next_seq, now, len(data))
+                    payload = data[:max_payload]
+                    ring[offset + RING_REC_HDR.size:offset + RING_REC_HDR.size + len(payload)] = payload
+                    next_seq += 1
+                RING_HDR.pack_into(ring, 0, RING_MAGIC, capacity, record_bytes, next_seq)
+                ring.flush()
+        return next_seq - 1
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def read_history(since, limit):
+    """
+    Messages with a sequence number above since, oldest first. The first slot is
+    found with offset math, so a page costs O(limit) no matter how full the ring is.
+    """
+    import mmap
+    try:
+        f = open(GlobalArgs.HISTORY_FILE_PATH, "rb")
+    except FileNotFoundError:
+        return {"messages": [], "oldest_seq": 0, "latest_seq": 0}
+    with f:
+        _lock(f, fcntl.LOCK_SH)
+        try:
+            if os.fstat(f.fileno()).st_size < RING_HDR_BYTES:
+                return {"messages": [], "oldest_seq": 0, "latest_seq": 0}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as ring:
+                _, capacity, record_bytes, next_seq = RING_HDR.unpack_from(ring, 0)
+                latest_seq = next_seq - 1
+                oldest_seq = max(1, next_seq - capacity)
+                # Readers that fell behind the ring resume at the oldest slot still held
+                first_seq = max(since + 1, oldest_seq)
+                messages = []
+                with Span("ReadBack"):
+                    for seq in range(first_seq, min(latest_seq, first_seq + limit - 1) + 1):
+                        offset = _ring_slot_offset(seq, capacity, record_bytes)
+                        rec_seq, ts, length = RING_REC_HDR.unpack_from(ring, offset)
+                        start = offset + RING_REC_HDR.size
+                        payload_len = min(length, record_bytes - RING_REC_HDR.size)
+                        messages.append({
+                            "seq": rec_seq,
+                            "ts": ts,
+                            "message": ring[start:start + payload_len].decode("utf-8", errors="replace"),
+                            "truncated": length > payload_len
+                        })
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return {"messages": messages, "oldest_seq": oldest_seq if latest_seq else 0, "latest_seq": latest_seq}
+
+
+def get_history_response(event):
+    params = event.get("queryStringParameters") or {}
+    try:
+        since = max(0, int(params.get("since") or 0))
+        limit = min(GlobalArgs.HISTORY_MAX_LIMIT, max(1, int(params.get("limit") or 50)))
+    except ValueError:
+        return {"statusCode": 400, "body": json.dumps({"message": "since and limit must be integers"})}
+    history = read_history(since, limit)
+    history["next_since"] = history["messages"][-1]["seq"] if history["messages"] else since
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(history)
+    }
+
+
+def update_site(topic, msgs):
+    """ Re-render only the site pages that depend on topic """
+    global SITE
+    if SITE is None:
+        from incremental_site import IncrementalSite
+        SITE = IncrementalSite(GlobalArgs.SITE_ROOT, atomic_publish)
+    with Span("SiteRender"):
+        rewritten = SITE.add_messages(topic, msgs)
+    logger.debug("site_pages_rewritten:%s", rewritten)
+
+
+def add_messages(msgs, file_path=None, topic=None):
+    """ Apply all msgs with a single EFS write & lock acquisition """
+    if msgs:
+        # Shards are written directly, the journal only feeds the top level index.html
+        if GlobalArgs.WRITE_MODE == "journal" and file_path is None:
+            seg_id, end_offset = append_to_journal(msgs)
+            maybe_compact_journal(seg_id, end_offset)
+        else:
+            publish_html(render_html(msgs), file_path)
+        after_publish(msgs, file_path, topic)
+
+
+def after_publish(msgs, file_path=None, topic=None):
+    """ History & site follow every publish, rendered or streamed """
+    if GlobalArgs.HISTORY_ENABLED and file_path is None:
+        append_to_history(msgs)
+    if GlobalArgs.SITE_ENABLED:
+        update_site(topic or GlobalArgs.SITE_DEFAULT_TOPIC, msgs)
+
+
+def stream_excerpt(body, is_base64=False):
+    """ Short stand-in for a streamed message, the full body only lives in its page """
+    if is_base64:
+        return f"[binary message of {len(body) * 3 // 4} bytes]"
+    if len(body) <= GlobalArgs.STREAM_EXCERPT_CHARS:
+        return body
+    return f"{body[:GlobalArgs.STREAM_EXCERPT_CHARS]}... [{len(body)} characters]"
+
+
+def add_message(_msg, file_path=None, topic=None):
+    if _msg:
+        add_messages([_msg], file_path, topic)
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def parse_batch(event):
+    """
+    Split a JSON array or NDJSON body into messages. Returns (msgs, results)
+    where results has one entry per item and only valid items are in msgs.
+    """
+    body = _decode_body(event.get("body") or "", event.get("isBase64Encoded"))
+    content_type = (_get_header(event, "content-type") or "").split(";")[0].strip().lower()
+    if content_type == "application/x-ndjson":
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("A JSON batch must be an array")
+    if len(items) > GlobalArgs.MAX_BATCH_SIZE:
+        raise BatchTooLarge(f"Batch of {len(items)} exceeds MAX_BATCH_SIZE {GlobalArgs.MAX_BATCH_SIZE}")
+
+    msgs, results = [], []
+    for i, item in enumerate(items):
+        if isinstance(item, str) and item:
+            msgs.append(item)
+            results.append({"index": i, "status": "added"})
+        else:
+            results.append({"index": i, "status": "rejected", "error": "Message must be a non-empty string"})
+    return msgs, results
+
+
+def _decode_body(body, is_base64):
+    if not is_base64:
+        return body
+    import base64
+    return base64.b64decode(body).decode("utf-8", errors="replace")
+
+
+def _body_too_large(body, is_base64):
+    """ Cheap upfront size check, before anything is decoded or written """
+    body_bytes = len(body) * 3 // 4 if is_base64 else len(body)
+    return body_bytes > GlobalArgs.MAX_BODY_BYTES
+
+
+def _is_batch_body(content_type, body, is_base64=False):
+    """
+    NDJSON, or JSON whose body is an array. Any other body, a single JSON
+    object included, is one message like before batches were supported.
+    """
+    content_type = (content_type or "").lower()
+    if content_type.startswith("application/x-ndjson"):
+        return True
+    if not content_type.startswith("application/json"):
+        return False
+    # The first chunk is enough, a large body is not decoded or copied twice
+    head = _decode_body(body[:GlobalArgs.STREAM_CHUNK_CHARS], is_base64)
+    return head.lstrip().startswith("[")
+
+
+def _is_batch(event):
+    return _is_batch_body(
+        _get_header(event, "content-type"), event.get("body") or "", bool(event.get("isBase64Encoded")))
+
+
+def add_batch_response(event, context, file_path=None, topic=None):
+    try:
+        msgs, results = parse_batch(event)
+    except BatchTooLarge as e:
+        return {"statusCode": 413, "body": json.dumps({"message": str(e)})}
+    except ValueError as e:
+        return {"statusCode": 400, "body": json.dumps({"message": f"Unable to parse batch: {e}"})}
+    if not msgs:
+        # Nothing written, the client must not mistake this for a success
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"message": f"0 of {len(results)} messages added", "results": results})
+        }
+    add_messages(msgs, file_path, topic)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "message": f"{len(msgs)} of {len(results)} messages added",
+            "results": results,
+            "lambda_version": context.function_version,
+            "ts": str(datetime.datetime.now())
+        })
+    }
+
+
+def _is_sqs_event(event):
+    records = event.get("Records")
+    return bool(records) and records[0].get("eventSource") == "aws:sqs"
+
+
+def _sqs_attribute(record, name):
+    return ((record.get("messageAttributes") or {}).get(name) or {}).get("stringValue")
+
+
+def _sqs_messages(record):
+    """ Messages carried by one SQS record, a JSON array or NDJSON body is expanded like a batch POST """
+    body = record.get("body") or ""
+    content_type = _sqs_attribute(record, "ContentType")
+    if _is_batch_body(content_type, body):
+        msgs, _ = parse_batch({"body": body, "headers": {"content-type": content_type}})
+        return msgs
+    return [body] if body else []
+
+
+def handle_sqs_batch(event):
+    """
+    Apply an SQS batch with one EFS write & lock acquisition per target page.
+    Records of a page that could not be written are reported back in
+    batchItemFailures, so SQS redelivers only those. API Gateway has already
+    answered 202, so records that can never be applied (bad key, batch over
+    MAX_BATCH_SIZE, unparsable body) are reported as well. They are redelivered
+    until max_receive_count & then land in the dead letter queue, not lost.
+    """
+    groups = {}
+    failures = []
+    for record in event["Records"]:
+        try:
+            key = _content_key({"headers": {"x-content-key": _sqs_attribute(record, "ContentKey")}})
+            msgs = _sqs_messages(record)
+        except (BatchTooLarge, ValueError) as e:
+            logger.warning("sqs_record_rejected:%s error:%s", record.get("messageId"), e)
+            failures.append({"itemIdentifier": record["messageId"]})
+            continue
+        group = groups.setdefault(key, ([], []))
+        group[0].append(record["messageId"])
+        group[1].extend(msgs)
+
+    for key, (message_ids, msgs) in groups.items():
+        try:
+            file_path = prepare_shard(key) if key and msgs else None
+            add_messages(msgs, file_path, key)
+        except Exception:
+            logger.exception("sqs_batch_write_failed key:%s", key)
+            failures.extend({"itemIdentifier": message_id} for message_id in message_ids)
+    return {"batchItemFailures": failures}
+
+
+def _get_header(event, name):
+    headers = event.get("headers") or {}
+    for k, v in headers.items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+def get_content_response(event, file_path=None):
+    """ Serve the current page, or a bodyless 304 if the client already has it """
+    content = get_messages(file_path)
+    etag = content_etag(content, file_path)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={GlobalArgs.CACHE_MAX_AGE_SECS}, must-revalidate"
+    }
+    if_none_match = _get_header(event, "if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip().replace("W/", "", 1) for t in if_none_match.split(",")]):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    headers["Content-Type"] = "text/html; charset=utf-8"
+    return {"statusCode": 200, "headers": headers, "body": content}
+
+
+def _content_key(event):
+    """ Shard key from the {mystique} path parameter or the X-Content-Key header """
+    key = (event.get("pathParameters") or {}).get("mystique") or _get_header(event, "x-content-key")
+    if key is not None and not (0 < len(key) <= 64 and set(key) <= SHARD_KEY_CHARS):
+        raise ValueError("Content key must be 1-64 characters of [A-Za-z0-9_-]")
+    return key
+
+
+def _idempotency_key(event):
+    """
+    Client supplied Idempotency-Key. API Gateway gives every client retry a new
+    request id and Lambda never retries a proxy invocation, so there is nothing
+    to dedupe on without one.
+    """
+    return _get_header(event, "idempotency-key")
+
+
+def _handle_post(event, context, content_key, file_path):
     greet_msg = "API Method unsupported."
+    new_message = event.get("body")
+    is_base64 = bool(event.get("isBase64Encoded"))
+    if new_message and _body_too_large(new_message, is_base64):
+        METRICS["operation"] = "Rejected"
+        return {
+            "statusCode": 413,
+            "body": json.dumps({"message": f"Body exceeds MAX_BODY_BYTES {GlobalArgs.MAX_BODY_BYTES}"})
+        }
+    if content_key and new_message:
+        file_path = prepare_shard(content_key)
+    if _is_batch(event):
+        METRICS["operation"] = "PostBatch"
+        return add_batch_response(event, context, file_path, content_key)
+    if new_message:
+        if len(new_message) >= GlobalArgs.STREAM_MIN_BYTES and (GlobalArgs.WRITE_MODE != "journal" or file_path):
+            METRICS["operation"] = "PostStream"
+            stream_message(new_message, is_base64, file_path)
+            after_publish([stream_excerpt(new_message, is_base64)], file_path, content_key)
+        else:
+            add_message(_decode_body(new_message, is_base64), file_path, content_key)
+            get_messages(file_path)
+        greet_msg = "Message added successfully! Go Rock the world"
+    return _greet_response(greet_msg, context)
 
-    # random_sleep(GlobalArgs.RANDOM_SLEEP_SECS)
-    method = event["requestContext"]["httpMethod"]
-    if method == "POST":
-        new_message = event.get("body")
-        if new_message:
-            add_message(new_message)
-            get_messages()
-            greet_msg = "Message added successfully! Go Rock the world"
 
+def _greet_response(greet_msg, context):
     msg = {
         "statusCode": 200,
         "body": (
@@ -93,3 +1067,71 @@ def lambda_handler(event, context):
     }
 
     return msg
+
+
+def _handle(event, context):
+    greet_msg = "API Method unsupported."
+
+    # Scheduled rule flushes journal records left behind by the last burst, evicts stale idempotency keys
+    # & invalidates the pages published since its last run on the CDN
+    if event.get("source") == "aws.events":
+        METRICS["operation"] = "Housekeeping"
+        if GlobalArgs.WRITE_MODE == "journal":
+            compact_journal()
+        if GlobalArgs.IDEMPOTENCY_ENABLED:
+            sweep_idempotency()
+        if GlobalArgs.CDN_DISTRIBUTION_ID or CDN_INVALIDATOR:
+            # Pages the compaction just published go out with the same batch
+            queue_invalidations()
+            flush_invalidations()
+        return {"statusCode": 200, "body": '{"message": "Housekeeping complete"}'}
+
+    # Async ingestion, API Gateway enqueued the POSTs & SQS hands them over in batches
+    if _is_sqs_event(event):
+        METRICS["operation"] = "SqsBatch"
+        return handle_sqs_batch(event)
+
+    # random_sleep(GlobalArgs.RANDOM_SLEEP_SECS)
+    method = event["requestContext"]["httpMethod"]
+    try:
+        content_key = _content_key(event)
+    except ValueError as e:
+        METRICS["operation"] = "Rejected"
+        return {"statusCode": 400, "body": json.dumps({"message": str(e)})}
+    file_path = shard_path(content_key) if content_key else None
+
+    METRICS["operation"] = method.capitalize()
+    if method == "GET" and "since" in (event.get("queryStringParameters") or {}):
+        METRICS["operation"] = "GetHistory"
+        return get_history_response(event)
+    if method == "GET":
+        return get_content_response(event, file_path)
+    if method == "POST":
+        request_id = _idempotency_key(event) if GlobalArgs.IDEMPOTENCY_ENABLED else None
+        if request_id:
+            response = lookup_request(request_id)
+            if response is not None:
+                # Retried request, hand back the original result without touching the content
+                METRICS["operation"] = "PostReplay"
+                response.setdefault("headers", {})["Idempotent-Replay"] = "true"
+                return response
+        response = _handle_post(event, context, content_key, file_path)
+        if request_id and response["statusCode"] == 200:
+            store_request(request_id, response)
+        return response
+
+    return _greet_response(greet_msg, context)
+
+
+def lambda_handler(event, context):
+    if _payload_sampled():
+        logger.info("rcvd_evnt:\n%s", event)
+    METRICS["operation"] = None
+    METRICS["timings"] = {}
+    PUBLISHED_PATHS.clear()
+    try:
+        with Span("Handler"):
+            return _handle(event, context)
+    finally:
+        queue_invalidations()
+        emit_metrics(context.function_version)
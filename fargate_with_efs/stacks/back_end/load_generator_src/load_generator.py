@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio load generator for the content creator API (POST) and the web service (GET).
+
+Requests are started on a fixed schedule of --rate per second, independent of how
+fast responses come back, and are spread over --concurrency keep-alive
+connections. Latency is measured from the scheduled start, so time spent queued
+behind a slow server is counted. Service time (send to last byte) is reported
+separately. A --rate of 0 runs closed loop, every connection fires its next
+request as soon as the last one returns.
+
+Standard library only. Results are printed as JSON, per target: request &
+error counts, status codes, latency percentiles & a latency histogram.
+
+    python3 load_generator.py --post-url https://<api>/prod/well-architected-api/create-content \\
+        --get-url http://<alb> --rate 50 --concurrency 20 --duration-secs 60 --payload-bytes 256
+    python3 load_generator.py --stub --rate 200 --duration-secs 5     # against a local stub server
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import ssl
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    ENVIRONMENT = "production"
+    MODULE_NAME = "load_generator"
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    POST_URL = os.getenv("POST_URL", "")
+    GET_URL = os.getenv("GET_URL", "")
+    POST_RATIO = float(os.getenv("POST_RATIO", 0.1))
+    RATE = float(os.getenv("RATE", 10))
+    CONCURRENCY = int(os.getenv("CONCURRENCY", 10))
+    DURATION_SECS = float(os.getenv("DURATION_SECS", 30))
+    PAYLOAD_BYTES = int(os.getenv("PAYLOAD_BYTES", 128))
+    TIMEOUT_SECS = float(os.getenv("TIMEOUT_SECS", 10))
+
+
+def set_logging(lv=GlobalArgs.LOG_LEVEL):
+    """ Helper to enable logging """
+    logging.basicConfig(level=lv)
+    logger = logging.getLogger()
+    logger.setLevel(lv)
+    return logger
+
+
+logger = set_logging()
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    """ One keep-alive HTTP/1.1 connection, re-opened after errors or Connection: close """
+
+    def __init__(self, url, timeout_secs):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == "https"
+        self.port = parts.port or (443 if self.tls else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.timeout_secs = timeout_secs
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        ssl_context = ssl.create_default_context() if self.tls else None
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=ssl_context)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _read_body(self, headers):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    return
+        elif "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+            self.close()
+
+    async def _request(self, method, body):
+        if self.writer is None:
+            await self._connect()
+        head = (
+            f"{method} {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            "User-Agent: mystique-load-generator\r\n"
+        )
+        # A GET carries no content headers, caches & the ALB see the request a browser would send
+        if body:
+            head += "Content-Type: text/plain\r\n"
+        if body or method == "POST":
+            head += f"Content-Length: {len(body)}\r\n"
+        self.writer.write((head + "\r\n").encode("ascii") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # HEAD-less & bodyless replies, a 304 from the GET endpoint has no body
+        if method != "HEAD" and status not in (204, 304):
+            await self._read_body(headers)
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+    async def request(self, method, body=b""):
+        """ Returns the status code, the connection is dropped on any error """
+        try:
+            return await asyncio.wait_for(self._request(method, body), self.timeout_secs)
+        except BaseException:
+            self.close()
+            raise
+
+
+class TargetStats:
+    """ Samples & errors of one target (post or get) """
+
+    def __init__(self):
+        self.latencies_ms = []
+        self.service_ms = []
+        self.status_counts = {}
+        self.error_types = {}
+
+    def record(self, status, latency_ms, service_ms):
+        self.latencies_ms.append(latency_ms)
+        self.service_ms.append(service_ms)
+        self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+
+    def record_error(self, error, latency_ms, service_ms):
+        self.latencies_ms.append(latency_ms)
+        self.service_ms.append(service_ms)
+        name = type(error).__name__
+        self.error_types[name] = self.error_types.get(name, 0) + 1
+
+    def summary(self, elapsed_secs):
+        requests = len(self.latencies_ms)
+        errors = sum(self.error_types.values()) + sum(
+            count for status, count in self.status_counts.items() if int(status) >= 400)
+        return {
+            "requests": requests,
+            "throughput_rps": requests / elapsed_secs if elapsed_secs else 0.0,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0.0,
+            "status_counts": self.status_counts,
+            "error_types": self.error_types,
+            "latency_ms": _percentiles(self.latencies_ms),
+            "service_ms": _percentiles(self.service_ms),
+            "histogram_ms": _histogram(self.latencies_ms)
+        }
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def _pct(p):
+        return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+    return {
+        "p50": _pct(50), "p90": _pct(90), "p99": _pct(99), "p999": _pct(99.9),
+        "max": values[-1], "mean": statistics.mean(values)
+    }
+
+
+def _histogram(values):
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for v in values:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if v <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [str(b) for b in HISTOGRAM_BOUNDS_MS] + ["inf"]
+    return [{"le_ms": label, "count": count} for label, count in zip(labels, counts)]
+
+
+def _payload(worker_id, seq, payload_bytes):
+    """ Unique per request, the greeter skips rewrites of byte-identical content """
+    prefix = f"load {worker_id}-{seq} "
+    return (prefix + "x" * max(0, payload_bytes - len(prefix))).encode("ascii")
+
+
+class LoadGenerator:
+
+    def __init__(self, post_url, get_url, post_ratio, rate, concurrency, duration_secs, payload_bytes, timeout_secs):
+        if not post_url and not get_url:
+            raise ValueError("Need a post_url, a get_url or both")
+        self.post_url = post_url
+        self.get_url = get_url
+        # Only one of the urls given, everything goes there
+        self.post_ratio = post_ratio if (post_url and get_url) else (1.0 if post_url else 0.0)
+        self.rate = rate
+        self.concurrency = concurrency
+        self.duration_secs = duration_secs
+        self.payload_bytes = payload_bytes
+        self.timeout_secs = timeout_secs
+        self.stats = {"post": TargetStats(), "get": TargetStats()}
+
+    async def _fire(self, worker_id, seq, connections, scheduled_at):
+        target = "post" if random.random() < self.post_ratio else "get"
+        sent_at = time.perf_counter()
+        try:
+            if target == "post":
+                status = await connections["post"].request("POST", _payload(worker_id, seq, self.payload_bytes))
+            else:
+                status = await connections["get"].request("GET")
+        except (OSError, asyncio.TimeoutError, HttpError, ValueError, asyncio.IncompleteReadError) as e:
+            done_at = time.perf_counter()
+            self.stats[target].record_error(e, (done_at - scheduled_at) * 1000, (done_at - sent_at) * 1000)
+            return
+        done_at = time.perf_counter()
+        self.stats[target].record(status, (done_at - scheduled_at) * 1000, (done_at - sent_at) * 1000)
+
+    def _connections(self):
+        connections = {}
+        if self.post_url:
+            connections["post"] = Connection(self.post_url, self.timeout_secs)
+        if self.get_url:
+            connections["get"] = Connection(self.get_url, self.timeout_secs)
+        return connections
+
+    async def _open_loop_worker(self, worker_id, schedule):
+        connections = self._connections()
+        seq = 0
+        while True:
+            scheduled_at = await schedule.get()
+            if scheduled_at is None:
+                break
+            await self._fire(worker_id, seq, connections, scheduled_at)
+            seq += 1
+        for connection in connections.values():
+            connection.close()
+
+    async def _closed_loop_worker(self, worker_id, deadline):
+        connections = self._connections()
+        seq = 0
+        while time.perf_counter() < deadline:
+            await self._fire(worker_id, seq, connections, time.perf_counter())
+            seq += 1
+        for connection in connections.values():
+            connection.close()
+
+    async def _schedule(self, schedule, begin):
+        """ Hand out start times at a fixed rate, a slow server does not slow the schedule down """
+        seq = 0
+        while True:
+            scheduled_at = begin + seq / self.rate
+            if scheduled_at - begin >= self.duration_secs:
+                break
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            schedule.put_nowait(scheduled_at)
+            seq += 1
+        for _ in range(self.concurrency):
+            schedule.put_nowait(None)
+
+    async def run(self):
+        begin = time.perf_counter()
+        if self.rate > 0:
+            schedule = asyncio.Queue()
+            await asyncio.gather(
+                self._schedule(schedule, begin),
+                *[self._open_loop_worker(i, schedule) for i in range(self.concurrency)]
+            )
+        else:
+            deadline = begin + self.duration_secs
+            await asyncio.gather(*[self._closed_loop_worker(i, deadline) for i in range(self.concurrency)])
+        elapsed = time.perf_counter() - begin
+        return {
+            "python": sys.version.split()[0],
+            "rate": self.rate,
+            "concurrency": self.concurrency,
+            "duration_secs": self.duration_secs,
+            "elapsed_secs": elapsed,
+            "payload_bytes": self.payload_bytes,
+            "post_ratio": self.post_ratio,
+            "targets": {
+                target: stats.summary(elapsed)
+                for target, stats in self.stats.items() if stats.latencies_ms
+            }
+        }
+
+
+async def serve_stub(host="127.0.0.1", port=0, delay_ms=0.0):
+    """
+    Minimal keep-alive HTTP server that answers every request with a 200, for
+    running the generator without the stacks. Returns the asyncio server.
+    """
+    async def _handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value)
+                if content_length:
+                    await reader.readexactly(content_length)
+                if delay_ms:
+                    await asyncio.sleep(delay_ms / 1000)
+                body = b'{"message": "stub"}'
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_handle, host, port)
+
+
+async def _main(args):
+    post_url, get_url = args.post_url, args.get_url
+    stub = None
+    if args.stub:
+        stub = await serve_stub(delay_ms=args.stub_delay_ms)
+        stub_port = stub.sockets[0].getsockname()[1]
+        post_url = post_url or f"http://127.0.0.1:{stub_port}/create-content"
+        get_url = get_url or f"http://127.0.0.1:{stub_port}/index.html"
+    try:
+        generator = LoadGenerator(
+            post_url=post_url,
+            get_url=get_url,
+            post_ratio=args.post_ratio,
+            rate=args.rate,
+            concurrency=args.concurrency,
+            duration_secs=args.duration_secs,
+            payload_bytes=args.payload_bytes,
+            timeout_secs=args.timeout_secs
+        )
+        return await generator.run()
+    finally:
+        if stub is not None:
+            stub.close()
+            await stub.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the content creator API & the web service with load")
+    parser.add_argument("--post-url", default=GlobalArgs.POST_URL, help="Content creator API url, POSTed to")
+    parser.add_argument("--get-url", default=GlobalArgs.GET_URL, help="Web service url, fetched with GET")
+    parser.add_argument("--post-ratio", type=float, default=GlobalArgs.POST_RATIO, help="Fraction of requests that are POSTs")
+    parser.add_argument("--rate", type=float, default=GlobalArgs.RATE, help="Requests started per second, 0 for closed loop")
+    parser.add_argument("--concurrency", type=int, default=GlobalArgs.CONCURRENCY, help="Keep-alive connections per url")
+    parser.add_argument("--duration-secs", type=float, default=GlobalArgs.DURATION_SECS)
+    parser.add_argument("--payload-bytes", type=int, default=GlobalArgs.PAYLOAD_BYTES, help="Size of every POST body")
+    parser.add_argument("--timeout-secs", type=float, default=GlobalArgs.TIMEOUT_SECS, help="Per request timeout")
+    parser.add_argument("--stub", action="store_true", help="Start a local stub server for urls that are not given")
+    parser.add_argument("--stub-delay-ms", type=float, default=0.0, help="Delay the stub adds to every response")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(_main(args))
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
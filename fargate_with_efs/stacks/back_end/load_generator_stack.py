@@ -0,0 +1,115 @@
+from aws_cdk import aws_ec2 as _ec2
+from aws_cdk import aws_ecs as _ecs
+from aws_cdk import aws_logs as _logs
+from aws_cdk import core
+
+import os
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    ENVIRONMENT = "production"
+    REPO_NAME = "fargate-with-efs"
+    SOURCE_INFO = f"https://github.com/miztiik/{REPO_NAME}"
+    VERSION = "2020_09_07"
+    MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
+
+
+class LoadGeneratorStack(core.Stack):
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        vpc,
+        post_url: str,
+        get_url: str,
+        vpc_subnets=None,
+        task_count: int = 1,
+        task_cpu: int = 512,
+        task_memory_mib: int = 1024,
+        rate: float = 50,
+        concurrency: int = 20,
+        duration_secs: int = 300,
+        payload_bytes: int = 128,
+        post_ratio: float = 0.1,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        load_gen_subnets = vpc_subnets or _ec2.SubnetSelection(
+            subnet_type=_ec2.SubnetType.PRIVATE)
+
+        # Outbound only, the generator drives the API & the ALB and takes no traffic
+        load_gen_sg = _ec2.SecurityGroup(
+            self,
+            id="loadGenSecurityGroup",
+            vpc=vpc,
+            security_group_name=f"load_gen_sg_{id}",
+            description="Security Group for the load generator tasks",
+            allow_all_outbound=True
+        )
+
+        load_gen_cluster = _ecs.Cluster(
+            self,
+            "loadGenClusterId",
+            cluster_name=f"load-gen-{id}",
+            vpc=vpc
+        )
+
+        load_gen_task_def = _ecs.FargateTaskDefinition(
+            self,
+            "loadGenTaskDef",
+            cpu=task_cpu,
+            memory_limit_mib=task_memory_mib
+        )
+
+        # Every task runs one asyncio generator for duration_secs, prints its JSON report & exits
+        load_gen_task_def.add_container(
+            "loadGenContainer",
+            image=_ecs.ContainerImage.from_asset(
+                os.path.join(os.path.dirname(__file__), "load_generator_src"),
+                exclude=["__pycache__", "*.pyc"]),
+            environment={
+                "POST_URL": post_url,
+                "GET_URL": get_url,
+                "POST_RATIO": f"{post_ratio}",
+                "RATE": f"{rate}",
+                "CONCURRENCY": f"{concurrency}",
+                "DURATION_SECS": f"{duration_secs}",
+                "PAYLOAD_BYTES": f"{payload_bytes}"
+            },
+            logging=_ecs.LogDrivers.aws_logs(
+                stream_prefix="load-generator",
+                log_retention=_logs.RetentionDays.ONE_WEEK)
+        )
+
+        subnet_ids = vpc.select_subnets(
+            subnet_group_name=load_gen_subnets.subnet_group_name,
+            subnet_type=load_gen_subnets.subnet_type
+        ).subnet_ids
+
+        # Outputs
+        output_0 = core.CfnOutput(
+            self,
+            "AutomationFrom",
+            value=f"{GlobalArgs.SOURCE_INFO}",
+            description="To know more about this automation stack, check out our github page."
+        )
+
+        output_1 = core.CfnOutput(
+            self,
+            "LoadGenRunTaskCommand",
+            value=(
+                f"aws ecs run-task --cluster {load_gen_cluster.cluster_name}"
+                f" --task-definition {load_gen_task_def.task_definition_arn}"
+                f" --count {task_count} --launch-type FARGATE --platform-version 1.4.0"
+                f" --network-configuration 'awsvpcConfiguration={{subnets=[{core.Fn.join(',', subnet_ids)}],"
+                f"securityGroups=[{load_gen_sg.security_group_id}],assignPublicIp=DISABLED}}'"
+            ),
+            description="Start the load test, every task reports its latency histogram & error rate to its log stream"
+        )
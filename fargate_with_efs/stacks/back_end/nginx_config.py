@@ -0,0 +1,87 @@
+"""
+Helper to render an nginx.conf tuned for serving web assets from EFS.
+
+Every request nginx serves from the EFS volume costs NFS open/stat round trips.
+open_file_cache keeps descriptors & metadata of hot files for a validity
+window, so most requests never leave the task. The rest of the settings size
+workers to the task CPU and keep connections from the ALB alive.
+"""
+
+
+def worker_processes_for(task_cpu: int) -> int:
+    """ One worker per vCPU of the Fargate task, 1024 CPU units make a vCPU """
+    return max(1, task_cpu // 1024)
+
+
+def render_nginx_conf(
+    task_cpu: int = 256,
+    nofile_limit: int = 65536,
+    open_file_cache_max: int = 10000,
+    open_file_cache_valid_secs: int = 5,
+    open_file_cache_inactive_secs: int = 60,
+    alb_idle_timeout_secs: int = 60,
+    enable_gzip_static: bool = True,
+    html_root: str = "/usr/share/nginx/html"
+) -> str:
+    workers = worker_processes_for(task_cpu)
+    # Each proxied request holds one descriptor for the client & one for the file
+    worker_connections = min(16384, nofile_limit // (2 * workers))
+    gzip_static = "on" if enable_gzip_static else "off"
+    return f"""user nginx;
+worker_processes {workers};
+worker_rlimit_nofile {nofile_limit};
+error_log /var/log/nginx/error.log warn;
+pid /var/run/nginx.pid;
+
+events {{
+    worker_connections {worker_connections};
+    multi_accept on;
+    use epoll;
+}}
+
+http {{
+    include /etc/nginx/mime.types;
+    default_type application/octet-stream;
+    log_format main '$remote_addr - $remote_user [$time_local] "$request" '
+                    '$status $body_bytes_sent "$http_referer" '
+                    '"$http_user_agent" "$http_x_forwarded_for" $request_time';
+    access_log /var/log/nginx/access.log main buffer=64k flush=5s;
+
+    sendfile on;
+    tcp_nopush on;
+    tcp_nodelay on;
+
+    # Outlive the ALB idle timeout, so the ALB always closes first and never hits a reset
+    keepalive_timeout {alb_idle_timeout_secs + 15}s;
+    keepalive_requests 10000;
+
+    # Cache descriptors, sizes & mtimes of EFS files instead of an NFS round trip per request.
+    # Content published by rename shows up within open_file_cache_valid. A page rewritten in place
+    # would be served with its cached size, app.py only allows the atomic publish mode of the greeter.
+    open_file_cache max={open_file_cache_max} inactive={open_file_cache_inactive_secs}s;
+    open_file_cache_valid {open_file_cache_valid_secs}s;
+    open_file_cache_min_uses 1;
+    open_file_cache_errors on;
+
+    # index.html.gz is written once per publish by the content creator
+    gzip_static {gzip_static};
+    gzip_vary on;
+
+    server_tokens off;
+
+    server {{
+        listen 80 default_server;
+        root {html_root};
+        index index.html;
+
+        # Journal, idempotency, history & temp files of the content creator
+        location ~ /\\. {{
+            return 404;
+        }}
+
+        location / {{
+            try_files $uri $uri/ =404;
+        }}
+    }}
+}}
+"""
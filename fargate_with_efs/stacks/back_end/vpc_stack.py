@@ -15,28 +15,60 @@ class GlobalArgs:
     MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
 
 
+# How private subnets reach AWS APIs & the internet:
+#   single-nat      one NAT gateway shared by every AZ
+#   per-az-nat      a NAT gateway in every AZ, no cross-AZ hop & no single point of failure
+#   endpoints-only  no NAT at all, the app subnets only reach AWS services through VPC endpoints
+#                   (app.py refuses the CloudFront cache & the load generator, neither has an endpoint)
+VPC_EGRESS_MODES = ["single-nat", "per-az-nat", "endpoints-only"]
+
+# Interface endpoints for Fargate image pulls (ECR api & dkr, layers come from S3),
+# awslogs & the EFS API. The S3 gateway endpoint is added alongside them.
+VPC_INTERFACE_ENDPOINTS = {
+    "ecrApi": _ec2.InterfaceVpcEndpointAwsService.ECR,
+    "ecrDkr": _ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    "logs": _ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+    "efs": _ec2.InterfaceVpcEndpointAwsService.ELASTIC_FILESYSTEM
+}
+
+
 class VpcStack(core.Stack):
 
     def __init__(
         self,
         scope: core.Construct,
         id: str,
-        from_vpc_name=None, ** kwargs
+        from_vpc_name=None,
+        max_azs: int = 2,
+        egress_mode: str = "single-nat",
+        enable_vpc_endpoints: bool = False,
+        ** kwargs
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        if egress_mode not in VPC_EGRESS_MODES:
+            raise ValueError(
+                f"Unknown VPC egress mode '{egress_mode}', choose one of {VPC_EGRESS_MODES}")
+        # Without NAT the endpoints are the only way out
+        enable_vpc_endpoints = enable_vpc_endpoints or egress_mode == "endpoints-only"
+
         if from_vpc_name is not None:
             self.vpc = _ec2.Vpc.from_lookup(
                 self, "vpc",
                 vpc_name=from_vpc_name
             )
+            self.app_subnets = _ec2.SubnetSelection(
+                subnet_type=_ec2.SubnetType.PRIVATE)
         else:
+            # CDK does not allow PRIVATE subnets without a NAT gateway, they are ISOLATED instead
+            app_subnet_type = _ec2.SubnetType.ISOLATED if egress_mode == "endpoints-only" else _ec2.SubnetType.PRIVATE
+            nat_gateways = {"single-nat": 1, "per-az-nat": max_azs, "endpoints-only": 0}[egress_mode]
             self.vpc = _ec2.Vpc(
                 self,
                 "miztiikVpc",
                 cidr="10.10.0.0/16",
-                max_azs=2,
-                nat_gateways=1,
+                max_azs=max_azs,
+                nat_gateways=nat_gateways,
                 enable_dns_support=True,
                 enable_dns_hostnames=True,
                 subnet_configuration=[
@@ -44,13 +76,43 @@ class VpcStack(core.Stack):
                         name="public", cidr_mask=24, subnet_type=_ec2.SubnetType.PUBLIC
                     ),
                     _ec2.SubnetConfiguration(
-                        name="app", cidr_mask=24, subnet_type=_ec2.SubnetType.PRIVATE
+                        name="app", cidr_mask=24, subnet_type=app_subnet_type
                     ),
                     _ec2.SubnetConfiguration(
                         name="db", cidr_mask=24, subnet_type=_ec2.SubnetType.ISOLATED
                     )
                 ]
             )
+            # Lambda, Fargate tasks & EFS mount targets go here, whichever type the subnets are
+            self.app_subnets = _ec2.SubnetSelection(subnet_group_name="app")
+
+        if enable_vpc_endpoints:
+            vpc_endpoint_sg = _ec2.SecurityGroup(
+                self,
+                id="vpcEndpointSecurityGroup",
+                vpc=self.vpc,
+                security_group_name=f"vpc_endpoint_sg_{id}",
+                description="Security Group to allow the app subnets to reach the VPC interface endpoints"
+            )
+            vpc_endpoint_sg.add_ingress_rule(
+                peer=_ec2.Peer.ipv4(self.vpc.vpc_cidr_block),
+                connection=_ec2.Port.tcp(443),
+                description="Allow HTTPS to the VPC interface endpoints from within the VPC"
+            )
+
+            # Image layers are served from S3, the gateway endpoint is free of data processing fees
+            self.vpc.add_gateway_endpoint(
+                "s3GatewayEndpoint",
+                service=_ec2.GatewayVpcEndpointAwsService.S3
+            )
+            for endpoint_name, endpoint_service in VPC_INTERFACE_ENDPOINTS.items():
+                self.vpc.add_interface_endpoint(
+                    f"{endpoint_name}InterfaceEndpoint",
+                    service=endpoint_service,
+                    subnets=self.app_subnets,
+                    security_groups=[vpc_endpoint_sg],
+                    private_dns_enabled=True
+                )
 
         output_0 = core.CfnOutput(
             self,
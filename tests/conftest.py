@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+
+# jsii warns on every node release it has not been tested with
+os.environ.setdefault("JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION", "1")
+
+# Lambda & sidecar sources are flat modules, imported the way their runtimes import them
+BACK_END_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "fargate_with_efs", "stacks", "back_end"
+)
+for src_dir in ["lambda_src", "efs_mirror_src", "load_generator_src"]:
+    sys.path.insert(0, os.path.join(BACK_END_DIR, src_dir))
+
+
+class SynthTemplate:
+    """ CloudFormation template of a synthesized stack """
+
+    def __init__(self, template):
+        self.template = template
+
+    def resources(self, resource_type):
+        """ Properties of every resource of resource_type, by logical id """
+        return {
+            logical_id: resource.get("Properties", {})
+            for logical_id, resource in self.template.get("Resources", {}).items()
+            if resource["Type"] == resource_type
+        }
+
+    def resource(self, resource_type):
+        """ Properties of the only resource of resource_type """
+        found = list(self.resources(resource_type).values())
+        assert len(found) == 1, f"expected one {resource_type}, found {len(found)}"
+        return found[0]
+
+
+@pytest.fixture
+def cdk_app(tmp_path):
+    core = pytest.importorskip("aws_cdk.core")
+    return core.App(outdir=str(tmp_path / "cdk.out"))
+
+
+@pytest.fixture
+def synth(cdk_app):
+    """ Synthesizes the app & returns the template of the given stack """
+    def _synth(stack):
+        return SynthTemplate(cdk_app.synth().get_stack_by_name(stack.stack_name).template)
+    return _synth
+
+
+@pytest.fixture
+def vpc_stack(cdk_app):
+    from fargate_with_efs.stacks.back_end.vpc_stack import VpcStack
+    return VpcStack(cdk_app, "vpc-stack")
+
+
+@pytest.fixture
+def efs_stack(cdk_app, vpc_stack):
+    from fargate_with_efs.stacks.back_end.efs_stack import EfsStack
+    return EfsStack(
+        cdk_app,
+        "efs-stack",
+        vpc=vpc_stack.vpc,
+        vpc_subnets=vpc_stack.app_subnets
+    )
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("aws_cdk.core")
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_app(tmp_path, **context):
+    """
+    Runs app.py with the context of cdk.json & the given overrides. Needs a fresh
+    interpreter, the jsii runtime reads CDK_CONTEXT_JSON only when it starts.
+    """
+    with open(os.path.join(REPO_ROOT, "cdk.json")) as f:
+        app_context = json.load(f)["context"]
+    app_context.update(context)
+    out_dir = tmp_path / "cdk.out"
+    env = dict(
+        os.environ,
+        CDK_OUTDIR=str(out_dir),
+        CDK_CONTEXT_JSON=json.dumps(app_context)
+    )
+    proc = subprocess.run(
+        [sys.executable, "app.py"],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    stacks = sorted(p.name[:-len(".template.json")] for p in out_dir.glob("*.template.json"))
+    return proc, stacks
+
+
+def test_endpoints_only_synthesizes_without_cdn(tmp_path):
+    proc, stacks = _run_app(tmp_path, vpc_egress_mode="endpoints-only")
+    assert proc.returncode == 0, proc.stderr
+    assert stacks == ["efs-content-creator-stack", "efs-stack", "fargate-with-efs", "vpc-stack"]
+
+
+@pytest.mark.parametrize(
+    "context, error",
+    [
+        ({"web_cdn_enabled": True}, "web_cdn_enabled needs a NAT egress mode"),
+        ({"load_gen_enabled": True}, "The load generator needs a NAT egress mode"),
+        ({"stacks": "load-generator-stack"}, "The load generator needs a NAT egress mode"),
+    ]
+)
+def test_endpoints_only_rejects_internet_bound_features(tmp_path, context, error):
+    proc, stacks = _run_app(tmp_path, vpc_egress_mode="endpoints-only", **context)
+    assert proc.returncode != 0
+    assert f"ValueError: {error}" in proc.stderr
+    assert stacks == []
+
+
+def test_efs_mirror_needs_atomic_publish(tmp_path):
+    proc, stacks = _run_app(tmp_path, web_efs_mirror_enabled=True, greeter_publish_mode="flock")
+    assert proc.returncode != 0
+    assert "ValueError: web_efs_mirror_enabled needs greeter_publish_mode atomic" in proc.stderr
+    assert stacks == []
+
+    proc, stacks = _run_app(tmp_path, web_efs_mirror_enabled=True, greeter_publish_mode="atomic")
+    assert proc.returncode == 0, proc.stderr
+    assert "fargate-with-efs" in stacks
+
+
+@pytest.mark.parametrize(
+    "context",
+    [
+        {},
+        {"stacks": "fargate-with-efs"},
+        # Built as a dependency of the CDN invalidations
+        {"stacks": "efs-content-creator-stack", "web_cdn_enabled": True},
+    ]
+)
+def test_web_service_needs_atomic_publish(tmp_path, context):
+    proc, stacks = _run_app(tmp_path, greeter_publish_mode="flock", **context)
+    assert proc.returncode != 0
+    assert "ValueError: fargate-with-efs needs greeter_publish_mode atomic" in proc.stderr
+    assert stacks == []
+
+
+def test_flock_publish_without_the_web_service(tmp_path):
+    proc, stacks = _run_app(tmp_path, greeter_publish_mode="flock", stacks="efs-content-creator-stack")
+    assert proc.returncode == 0, proc.stderr
+    assert stacks == ["efs-content-creator-stack", "efs-stack", "vpc-stack"]
@@ -0,0 +1,115 @@
+import pytest
+
+pytest.importorskip("aws_cdk.core")
+
+from fargate_with_efs.stacks.back_end.efs_content_creator_stack import EfsContentCreatorStack  # noqa: E402
+
+
+MORNING_SCHEDULE = {"name": "Morning", "expression": "cron(0 8 * * ? *)", "min": 5, "max": 10}
+
+
+def _creator_stack(cdk_app, vpc_stack, efs_stack, **kwargs):
+    return EfsContentCreatorStack(
+        cdk_app,
+        "efs-content-creator-stack",
+        vpc=vpc_stack.vpc,
+        efs_sg=efs_stack.efs_sg,
+        vpc_subnets=vpc_stack.app_subnets,
+        efs_share=efs_stack.efs_share,
+        efs_ap_nginx=efs_stack.efs_ap_nginx,
+        stack_log_level="INFO",
+        back_end_api_name="efs-content-creator",
+        **kwargs
+    )
+
+
+def test_provisioned_concurrency_scales_on_utilisation_and_schedule(cdk_app, synth, vpc_stack, efs_stack):
+    stack = _creator_stack(
+        cdk_app, vpc_stack, efs_stack,
+        provisioned_concurrency=2,
+        max_provisioned_concurrency=8,
+        provisioned_utilization_target=0.6,
+        provisioned_schedules=[MORNING_SCHEDULE]
+    )
+    template = synth(stack)
+
+    alias = template.resource("AWS::Lambda::Alias")
+    assert alias["ProvisionedConcurrencyConfig"] == {"ProvisionedConcurrentExecutions": 2}
+
+    target = template.resource("AWS::ApplicationAutoScaling::ScalableTarget")
+    assert target["ServiceNamespace"] == "lambda"
+    assert target["ScalableDimension"] == "lambda:function:ProvisionedConcurrency"
+    assert target["MinCapacity"] == 2
+    # The schedule raises the ceiling past max_provisioned_concurrency
+    assert target["MaxCapacity"] == 10
+    assert len(target["ScheduledActions"]) == 1
+    scheduled_action = target["ScheduledActions"][0]
+    assert scheduled_action["Schedule"] == "cron(0 8 * * ? *)"
+    assert scheduled_action["ScalableTargetAction"] == {"MinCapacity": 5, "MaxCapacity": 10}
+
+    policy = template.resource("AWS::ApplicationAutoScaling::ScalingPolicy")
+    assert policy["PolicyType"] == "TargetTrackingScaling"
+    config = policy["TargetTrackingScalingPolicyConfiguration"]
+    assert config["PredefinedMetricSpecification"]["PredefinedMetricType"] == "LambdaProvisionedConcurrencyUtilization"
+    assert config["TargetValue"] == 0.6
+
+
+def test_fixed_provisioned_concurrency_has_no_scaling(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_creator_stack(cdk_app, vpc_stack, efs_stack, provisioned_concurrency=3))
+
+    alias = template.resource("AWS::Lambda::Alias")
+    assert alias["ProvisionedConcurrencyConfig"] == {"ProvisionedConcurrentExecutions": 3}
+    assert template.resources("AWS::ApplicationAutoScaling::ScalableTarget") == {}
+
+
+def test_on_demand_by_default(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_creator_stack(cdk_app, vpc_stack, efs_stack))
+
+    assert "ProvisionedConcurrencyConfig" not in template.resource("AWS::Lambda::Alias")
+    assert template.resources("AWS::ApplicationAutoScaling::ScalableTarget") == {}
+    fn = template.resource("AWS::Lambda::Function")
+    assert fn["Runtime"] == "python3.7"
+    assert "Architectures" not in fn
+
+
+def test_arm64(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_creator_stack(cdk_app, vpc_stack, efs_stack, runtime="python3.8", architecture="arm64"))
+
+    fn = template.resource("AWS::Lambda::Function")
+    assert fn["Runtime"] == "python3.8"
+    assert fn["Architectures"] == ["arm64"]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"architecture": "riscv"},
+        {"architecture": "arm64"},
+        {"architecture": "arm64", "runtime": "python3.6"},
+        {"max_provisioned_concurrency": 8},
+        {"provisioned_schedules": [MORNING_SCHEDULE]},
+        {"provisioned_concurrency": 25},
+        {"provisioned_concurrency": 2, "provisioned_schedules": [dict(MORNING_SCHEDULE, max=40)]},
+    ]
+)
+def test_rejected_combinations(cdk_app, vpc_stack, efs_stack, kwargs):
+    with pytest.raises(ValueError):
+        _creator_stack(cdk_app, vpc_stack, efs_stack, **kwargs)
+
+
+def test_cdn_invalidations_run_from_housekeeping(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_creator_stack(
+        cdk_app, vpc_stack, efs_stack,
+        enable_idempotency=False,
+        cdn_distribution_id="E2EXAMPLE"
+    ))
+
+    rule = template.resource("AWS::Events::Rule")
+    assert rule["ScheduleExpression"] == "rate(1 minute)"
+    fn = template.resource("AWS::Lambda::Function")
+    assert fn["Environment"]["Variables"]["CDN_DISTRIBUTION_ID"] == "E2EXAMPLE"
+
+
+def test_no_housekeeping_without_journal_idempotency_or_cdn(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_creator_stack(cdk_app, vpc_stack, efs_stack, enable_idempotency=False))
+    assert template.resources("AWS::Events::Rule") == {}
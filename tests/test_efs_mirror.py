@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+import efs_mirror
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+
+
+def _publish(path, data):
+    """ Rename into place, the way the content creator's atomic publish mode does """
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    _write(tmp_path, data)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source, target = str(tmp_path / "efs"), str(tmp_path / "local")
+    os.makedirs(source)
+    os.makedirs(target)
+    return source, target
+
+
+@pytest.fixture
+def mirror(dirs):
+    # Full scans only when a test asks for one
+    return efs_mirror.EfsMirror(*dirs, full_scan_interval_secs=0)
+
+
+def test_initial_sync_copies_every_page_but_dot_files(dirs, mirror):
+    source, target = dirs
+    _write(f"{source}/index.html", "index")
+    _write(f"{source}/site/topics/a.html", "a")
+    _write(f"{source}/.history/ring.dat", "history")
+    _write(f"{source}/.index.html.1234.tmp", "half written")
+
+    copied, removed = mirror.sync_once()
+
+    assert sorted(copied) == ["index.html", "site/topics/a.html"]
+    assert removed == []
+    assert _read(f"{target}/site/topics/a.html") == "a"
+    assert sorted(os.listdir(target)) == ["index.html", "site"]
+
+
+def test_published_update_is_copied(dirs, mirror):
+    source, target = dirs
+    _publish(f"{source}/site/topics/a.html", "v1")
+    _publish(f"{source}/site/topics/b.html", "b")
+    mirror.sync_once()
+
+    _publish(f"{source}/site/topics/a.html", "v2")
+    assert mirror.sync_once() == (["site/topics/a.html"], [])
+    assert _read(f"{target}/site/topics/a.html") == "v2"
+    # Nothing moved since
+    assert mirror.sync_once() == ([], [])
+
+
+def test_new_directory_is_picked_up(dirs, mirror):
+    source, target = dirs
+    _write(f"{source}/index.html", "index")
+    mirror.sync_once()
+
+    _publish(f"{source}/shards/ab/page.html", "shard")
+    assert mirror.sync_once() == (["shards/ab/page.html"], [])
+    assert _read(f"{target}/shards/ab/page.html") == "shard"
+
+
+def test_deleted_files_and_directories_are_removed(dirs, mirror):
+    source, target = dirs
+    _write(f"{source}/index.html", "index")
+    _write(f"{source}/site/topics/a.html", "a")
+    _write(f"{source}/site/feed.xml", "feed")
+    mirror.sync_once()
+
+    os.remove(f"{source}/site/feed.xml")
+    assert mirror.sync_once() == ([], ["site/feed.xml"])
+    assert not os.path.exists(f"{target}/site/feed.xml")
+
+    os.remove(f"{source}/site/topics/a.html")
+    os.rmdir(f"{source}/site/topics")
+    assert mirror.sync_once() == ([], ["site/topics/a.html"])
+    assert not os.path.exists(f"{target}/site/topics/a.html")
+    assert "site/topics" not in mirror.dirs
+
+
+def test_unchanged_tree_costs_one_stat_per_directory(dirs, mirror, monkeypatch):
+    source, _ = dirs
+    for i in range(20):
+        _write(f"{source}/site/topics/t{i}.html", str(i))
+    mirror.sync_once()
+
+    stats = []
+    real_stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *a, **kw: stats.append(path) or real_stat(path, *a, **kw))
+    monkeypatch.setattr(efs_mirror, "copy_file", lambda *a: pytest.fail("nothing to copy"))
+
+    assert mirror.sync_once() == ([], [])
+    assert sorted(os.path.relpath(p, source) for p in stats) == [".", "site", "site/topics"]
+
+
+def test_in_place_write_is_caught_by_the_full_scan(dirs, mirror):
+    source, target = dirs
+    _write(f"{source}/index.html", "v1")
+    mirror.sync_once()
+
+    with open(f"{source}/index.html", "a") as f:
+        f.write(" v2")
+    # Same inode & the directory did not move
+    assert mirror.sync_once() == ([], [])
+
+    mirror.last_full_scan = None
+    assert mirror.sync_once() == (["index.html"], [])
+    assert _read(f"{target}/index.html") == "v1 v2"
+
+
+def test_torn_copy_is_discarded(dirs, monkeypatch):
+    source, target = dirs
+    _write(f"{source}/index.html", "v1")
+    real_copy = efs_mirror.shutil.copyfileobj
+
+    def _copy_during_write(src, dst, length):
+        real_copy(src, dst, length)
+        # A writer that does not take the flock changes the page mid copy
+        with open(f"{source}/index.html", "a") as f:
+            f.write(" v2")
+
+    monkeypatch.setattr(efs_mirror.shutil, "copyfileobj", _copy_during_write)
+    assert efs_mirror.copy_file(f"{source}/index.html", f"{target}/index.html") is None
+    assert os.listdir(target) == []
+
+    mirror = efs_mirror.EfsMirror(source, target, full_scan_interval_secs=0)
+    assert mirror.sync_once() == ([], [])
+    assert "index.html" not in mirror.synced
+
+    # The next poll lists the directory again & copies the settled page
+    monkeypatch.setattr(efs_mirror.shutil, "copyfileobj", real_copy)
+    assert mirror.sync_once() == (["index.html"], [])
+    assert _read(f"{target}/index.html") == "v1 v2 v2"
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("aws_cdk.core")
+
+from fargate_with_efs.stacks.back_end.efs_stack import (  # noqa: E402
+    EFS_PERFORMANCE_PROFILES,
+    EfsStack,
+    efs_performance_settings
+)
+
+
+def _efs_template(cdk_app, synth, vpc_stack, **kwargs):
+    stack = EfsStack(
+        cdk_app,
+        "efs-stack",
+        vpc=vpc_stack.vpc,
+        vpc_subnets=vpc_stack.app_subnets,
+        **kwargs
+    )
+    return synth(stack).resource("AWS::EFS::FileSystem")
+
+
+def test_latency_optimised_profile(cdk_app, synth, vpc_stack):
+    fs = _efs_template(cdk_app, synth, vpc_stack, performance_profile="latency-optimised")
+    assert fs["PerformanceMode"] == "generalPurpose"
+    assert fs["ThroughputMode"] == "bursting"
+    assert "ProvisionedThroughputInMibps" not in fs
+    assert "LifecyclePolicies" not in fs
+
+
+def test_throughput_optimised_profile(cdk_app, synth, vpc_stack):
+    fs = _efs_template(
+        cdk_app, synth, vpc_stack,
+        performance_profile="throughput-optimised",
+        provisioned_throughput_mibps=64
+    )
+    assert fs["PerformanceMode"] == "generalPurpose"
+    assert fs["ThroughputMode"] == "provisioned"
+    assert fs["ProvisionedThroughputInMibps"] == 64
+    assert "LifecyclePolicies" not in fs
+
+
+def test_cost_optimised_profile(cdk_app, synth, vpc_stack):
+    fs = _efs_template(cdk_app, synth, vpc_stack, performance_profile="cost-optimised")
+    assert fs["PerformanceMode"] == "generalPurpose"
+    assert fs["ThroughputMode"] == "bursting"
+    assert "ProvisionedThroughputInMibps" not in fs
+    assert fs["LifecyclePolicies"] == [{"TransitionToIA": "AFTER_7_DAYS"}]
+
+
+def test_every_profile_is_covered():
+    assert set(EFS_PERFORMANCE_PROFILES) == {"latency-optimised", "throughput-optimised", "cost-optimised"}
+
+
+@pytest.mark.parametrize(
+    "profile, provisioned_throughput_mibps",
+    [
+        ("max-io", None),
+        ("throughput-optimised", None),
+        ("throughput-optimised", 0),
+        ("latency-optimised", 64),
+        ("cost-optimised", 64),
+    ]
+)
+def test_rejected_combinations(profile, provisioned_throughput_mibps):
+    with pytest.raises(ValueError):
+        efs_performance_settings(profile, provisioned_throughput_mibps)
+
+
+def test_rejected_combination_fails_the_synth(cdk_app, vpc_stack):
+    with pytest.raises(ValueError):
+        EfsStack(cdk_app, "efs-stack", vpc=vpc_stack.vpc, performance_profile="throughput-optimised")
@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("aws_cdk.core")
+
+from fargate_with_efs.stacks.back_end.fargate_with_efs_stack import FargateWithEfsStack  # noqa: E402
+
+
+def _web_stack(cdk_app, vpc_stack, efs_stack, **kwargs):
+    return FargateWithEfsStack(
+        cdk_app,
+        "fargate-with-efs",
+        custom_vpc=vpc_stack.vpc,
+        efs_share=efs_stack.efs_share,
+        efs_ap_nginx=efs_stack.efs_ap_nginx,
+        task_subnets=vpc_stack.app_subnets,
+        **kwargs
+    )
+
+
+def _scaling_policies(template):
+    """ Target tracking configurations by predefined metric """
+    policies = {}
+    for props in template.resources("AWS::ApplicationAutoScaling::ScalingPolicy").values():
+        assert props["PolicyType"] == "TargetTrackingScaling"
+        config = props["TargetTrackingScalingPolicyConfiguration"]
+        policies[config["PredefinedMetricSpecification"]["PredefinedMetricType"]] = config
+    return policies
+
+
+def test_scales_on_requests_and_cpu(cdk_app, synth, vpc_stack, efs_stack):
+    stack = _web_stack(
+        cdk_app, vpc_stack, efs_stack,
+        enable_container_insights=True,
+        min_task_count=2,
+        max_task_count=6,
+        requests_per_target=800,
+        target_cpu_percent=55,
+        scale_in_cooldown_secs=180,
+        scale_out_cooldown_secs=45
+    )
+    template = synth(stack)
+
+    target = template.resource("AWS::ApplicationAutoScaling::ScalableTarget")
+    assert target["MinCapacity"] == 2
+    assert target["MaxCapacity"] == 6
+    assert target["ScalableDimension"] == "ecs:service:DesiredCount"
+    assert target["ServiceNamespace"] == "ecs"
+    assert template.resource("AWS::ECS::Service")["DesiredCount"] == 2
+
+    policies = _scaling_policies(template)
+    assert set(policies) == {"ALBRequestCountPerTarget", "ECSServiceAverageCPUUtilization"}
+    assert policies["ALBRequestCountPerTarget"]["TargetValue"] == 800
+    assert policies["ECSServiceAverageCPUUtilization"]["TargetValue"] == 55
+    for config in policies.values():
+        assert config["ScaleInCooldown"] == 180
+        assert config["ScaleOutCooldown"] == 45
+
+    cluster = template.resource("AWS::ECS::Cluster")
+    assert {"Name": "containerInsights", "Value": "enabled"} in cluster["ClusterSettings"]
+
+
+def test_fixed_task_count_has_no_scaling(cdk_app, synth, vpc_stack, efs_stack):
+    stack = _web_stack(cdk_app, vpc_stack, efs_stack, min_task_count=3, max_task_count=3)
+    template = synth(stack)
+
+    assert template.resources("AWS::ApplicationAutoScaling::ScalableTarget") == {}
+    assert template.resources("AWS::ApplicationAutoScaling::ScalingPolicy") == {}
+    assert template.resource("AWS::ECS::Service")["DesiredCount"] == 3
+    cluster = template.resource("AWS::ECS::Cluster")
+    assert {"Name": "containerInsights", "Value": "enabled"} not in cluster.get("ClusterSettings", [])
+
+
+def test_cdn_ttl_bounds_staleness(cdk_app, synth, vpc_stack, efs_stack):
+    template = synth(_web_stack(cdk_app, vpc_stack, efs_stack, enable_cdn=True, cdn_html_ttl_secs=120))
+
+    distribution = template.resource("AWS::CloudFront::Distribution")
+    behavior = distribution["DistributionConfig"]["DefaultCacheBehavior"]
+    assert behavior["DefaultTTL"] == 120
+    # Also caps any Cache-Control the origin might send later
+    assert behavior["MaxTTL"] == 120
@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+
+from incremental_site import IncrementalSite
+
+
+def _atomic_publish(file_path, data):
+    tmp_path = f"{file_path}.tmp-{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_only_dependent_pages_are_rendered(tmp_path):
+    site = IncrementalSite(str(tmp_path), _atomic_publish)
+
+    first = site.add_messages("news", ["hello"])
+    assert sorted(os.path.relpath(p, tmp_path) for p in first) == ["feed.xml", "index.html", "topics/news.html"]
+
+    # Known topic, the index is left alone
+    second = site.add_messages("news", ["again"])
+    assert sorted(os.path.relpath(p, tmp_path) for p in second) == ["feed.xml", "topics/news.html"]
+    assert "again" in _read(tmp_path / "topics" / "news.html")
+
+    site.add_messages("sport", ["goal"])
+    index = _read(tmp_path / "index.html")
+    assert "topics/news.html" in index and "topics/sport.html" in index
+
+
+def test_older_render_never_replaces_a_newer_one(tmp_path):
+    """ The first writer is slow to publish, the second must not be overwritten by it """
+    first_publishing = threading.Event()
+
+    def _slow_publish(file_path, data):
+        if file_path.endswith("feed.xml") and b">first<" in data and b">second<" not in data:
+            first_publishing.set()
+            time.sleep(0.3)
+        _atomic_publish(file_path, data)
+
+    site = IncrementalSite(str(tmp_path), _slow_publish)
+    site.add_messages("news", ["zero"])
+
+    first = threading.Thread(target=site.add_messages, args=("news", ["first"]))
+    first.start()
+    assert first_publishing.wait(5)
+    site.add_messages("news", ["second"])
+    first.join()
+
+    feed = _read(tmp_path / "feed.xml")
+    assert ">first<" in feed and ">second<" in feed
+    topic = _read(tmp_path / "topics" / "news.html")
+    assert "<p>second</p><p>first</p>" in topic
@@ -0,0 +1,100 @@
+import asyncio
+import socket
+
+import load_generator
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_against_stub(**kwargs):
+    async def _run():
+        stub = await load_generator.serve_stub()
+        port = stub.sockets[0].getsockname()[1]
+        try:
+            generator = load_generator.LoadGenerator(
+                post_url=f"http://127.0.0.1:{port}/create-content",
+                **dict({
+                    "get_url": "",
+                    "post_ratio": 1.0,
+                    "concurrency": 10,
+                    "payload_bytes": 64,
+                    "timeout_secs": 2
+                }, **kwargs)
+            )
+            return await generator.run()
+        finally:
+            stub.close()
+            await stub.wait_closed()
+    return asyncio.run(_run())
+
+
+def test_open_loop_holds_the_rate_and_accounts_for_errors():
+    # GETs go to a port nobody listens on, every one of them fails
+    results = _run_against_stub(
+        get_url=f"http://127.0.0.1:{_closed_port()}/index.html",
+        post_ratio=0.5,
+        rate=200,
+        duration_secs=1
+    )
+    post, get = results["targets"]["post"], results["targets"]["get"]
+
+    # Every scheduled start fires, finishing in about the duration
+    assert post["requests"] + get["requests"] == 200
+    assert 0.95 <= results["elapsed_secs"] < 1.5
+    assert 150 < (post["requests"] + get["requests"]) / results["elapsed_secs"] < 215
+
+    assert post["errors"] == 0
+    assert post["status_counts"] == {"200": post["requests"]}
+    assert post["error_types"] == {}
+
+    assert get["errors"] == get["requests"]
+    assert get["error_rate"] == 1.0
+    assert get["status_counts"] == {}
+    assert get["error_types"] == {"ConnectionRefusedError": get["requests"]}
+
+    for stats in (post, get):
+        assert sum(bucket["count"] for bucket in stats["histogram_ms"]) == stats["requests"]
+
+
+def test_closed_loop_histogram_sums_to_requests():
+    results = _run_against_stub(rate=0, concurrency=4, duration_secs=0.5)
+    post = results["targets"]["post"]
+    assert post["requests"] > 0
+    assert post["errors"] == 0
+    assert sum(bucket["count"] for bucket in post["histogram_ms"]) == post["requests"]
+
+
+def test_content_headers_only_with_a_body():
+    heads = []
+
+    async def _handle(reader, writer):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            heads.append(head.decode("ascii"))
+            length = [int(line.split(":")[1]) for line in head.decode("ascii").split("\r\n")
+                      if line.lower().startswith("content-length:")]
+            if length:
+                await reader.readexactly(length[0])
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            await writer.drain()
+
+    async def _run():
+        server = await asyncio.start_server(_handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = load_generator.Connection(f"http://127.0.0.1:{port}/", 2)
+        try:
+            assert await connection.request("GET") == 200
+            assert await connection.request("POST", b"hello") == 200
+        finally:
+            connection.close()
+            server.close()
+
+    asyncio.run(_run())
+    get_head, post_head = heads
+    assert "Content-Type" not in get_head and "Content-Length" not in get_head
+    assert "Content-Type: text/plain\r\n" in post_head
+    assert "Content-Length: 5\r\n" in post_head
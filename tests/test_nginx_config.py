@@ -0,0 +1,55 @@
+import re
+
+import pytest
+
+from fargate_with_efs.stacks.back_end.nginx_config import render_nginx_conf
+
+
+def _directive(conf, name):
+    """ Values of every `name ...;` directive in the rendered config """
+    return re.findall(rf"^\s*{re.escape(name)} ([^;]*);", conf, re.MULTILINE)
+
+
+@pytest.mark.parametrize(
+    "task_cpu, workers, connections",
+    [
+        (256, 1, 16384),
+        (1024, 1, 16384),
+        (4096, 4, 8192),
+    ]
+)
+def test_workers_sized_to_task_cpu(task_cpu, workers, connections):
+    conf = render_nginx_conf(task_cpu=task_cpu)
+    assert _directive(conf, "worker_processes") == [f"{workers}"]
+    assert _directive(conf, "worker_connections") == [f"{connections}"]
+    # Two descriptors per connection must fit the rlimit across all workers
+    assert workers * connections * 2 <= int(_directive(conf, "worker_rlimit_nofile")[0])
+
+
+def test_open_file_cache_window():
+    conf = render_nginx_conf(open_file_cache_valid_secs=3, open_file_cache_max=500, open_file_cache_inactive_secs=30)
+    assert _directive(conf, "open_file_cache_valid") == ["3s"]
+    assert _directive(conf, "open_file_cache") == ["max=500 inactive=30s"]
+    assert _directive(conf, "open_file_cache_errors") == ["on"]
+
+
+@pytest.mark.parametrize("enabled, value", [(True, "on"), (False, "off")])
+def test_gzip_static(enabled, value):
+    conf = render_nginx_conf(enable_gzip_static=enabled)
+    assert _directive(conf, "gzip_static") == [value]
+
+
+@pytest.mark.parametrize("alb_idle_timeout_secs", [60, 300])
+def test_keepalive_outlives_alb_idle_timeout(alb_idle_timeout_secs):
+    conf = render_nginx_conf(alb_idle_timeout_secs=alb_idle_timeout_secs)
+    keepalive = _directive(conf, "keepalive_timeout")
+    assert len(keepalive) == 1
+    assert int(keepalive[0].rstrip("s")) > alb_idle_timeout_secs
+
+
+def test_dot_files_are_not_served():
+    conf = render_nginx_conf(html_root="/efs/html")
+    assert _directive(conf, "root") == ["/efs/html"]
+    dot_files = re.search(r"location ~ /\\\. \{\s*return (\d+);\s*\}", conf)
+    assert dot_files is not None
+    assert dot_files.group(1) == "404"
@@ -0,0 +1,262 @@
+import json
+import os
+import uuid
+
+import pytest
+
+import serverless_greeter
+
+
+class _Ctx:
+    function_version = "test"
+
+
+@pytest.fixture
+def greeter(tmp_path, monkeypatch):
+    """ serverless_greeter with a temp directory standing in for the EFS mount """
+    efs = str(tmp_path / "efs")
+    os.makedirs(efs)
+    args = serverless_greeter.GlobalArgs
+    for name, value in {
+        "EFS_MNT_PATH": efs,
+        "INDEX_FILE_PATH": f"{efs}/index.html",
+        "SHARDS_DIR": f"{efs}/shards",
+        "IDEMPOTENCY_DIR": f"{efs}/.idempotency",
+        "HISTORY_FILE_PATH": f"{efs}/.history/ring.dat",
+        "SITE_ROOT": f"{efs}/site",
+        "JOURNAL_DIR": f"{efs}/.journal",
+        "CHECKPOINT_PATH": f"{efs}/.journal/checkpoint",
+        "CDN_PENDING_PATH": f"{efs}/.cdn/pending",
+        "METRICS_ENABLED": False,
+        "IDEMPOTENCY_ENABLED": True,
+    }.items():
+        monkeypatch.setattr(args, name, value)
+    monkeypatch.setattr(serverless_greeter, "READ_CACHE", {})
+    monkeypatch.setattr(serverless_greeter, "SITE", None)
+    monkeypatch.setattr(serverless_greeter, "CDN_INVALIDATOR", None)
+    serverless_greeter.PUBLISHED_PATHS.clear()
+    return serverless_greeter
+
+
+def _post(body, content_type="text/plain", key=None, headers=None):
+    return {
+        "requestContext": {"httpMethod": "POST", "requestId": uuid.uuid4().hex},
+        "headers": {"Content-Type": content_type, **(headers or {})},
+        "pathParameters": {"mystique": key} if key else None,
+        "body": body
+    }
+
+
+def _index(greeter):
+    with open(greeter.GlobalArgs.INDEX_FILE_PATH) as f:
+        return f.read()
+
+
+def test_post_without_idempotency_key_keeps_no_request_record(greeter):
+    for body in ["hello", "hello again"]:
+        assert greeter.lambda_handler(_post(body), _Ctx())["statusCode"] == 200
+    assert "hello again" in _index(greeter)
+    assert not os.path.exists(f"{greeter.GlobalArgs.IDEMPOTENCY_DIR}/requests")
+
+
+def test_idempotency_key_replays_the_first_response(greeter):
+    first = greeter.lambda_handler(_post("hello", headers={"Idempotency-Key": "k-1"}), _Ctx())
+    replay = greeter.lambda_handler(_post("changed", headers={"Idempotency-Key": "k-1"}), _Ctx())
+
+    assert replay["headers"]["Idempotent-Replay"] == "true"
+    assert replay["body"] == first["body"]
+    assert "changed" not in _index(greeter)
+    assert greeter.sweep_idempotency() == 0
+
+
+def test_identical_content_is_skipped_on_the_digest_record_only(greeter):
+    html = greeter.render_html(["same"])
+    assert greeter.publish_html(html) is True
+    assert greeter.publish_html(html) is False
+
+    # Without the record on EFS a matching stat & read cache are not enough to skip
+    os.remove(greeter._idempotency_path("content", greeter.GlobalArgs.INDEX_FILE_PATH))
+    assert greeter.publish_html(html) is True
+
+
+def test_streamed_page_is_not_mistaken_for_the_last_digest(greeter, monkeypatch):
+    monkeypatch.setattr(greeter.GlobalArgs, "STREAM_MIN_BYTES", 16)
+    greeter.lambda_handler(_post("small"), _Ctx())
+    greeter.lambda_handler(_post("x" * 64), _Ctx())
+    assert "x" * 64 in _index(greeter)
+
+    greeter.lambda_handler(_post("small"), _Ctx())
+    assert "<p>small</p>" in _index(greeter)
+
+
+class _FailingInvalidator:
+    def invalidate(self, paths):
+        raise ConnectionError("CloudFront unreachable")
+
+
+_HOUSEKEEPING = {"source": "aws.events"}
+
+
+def test_invalidations_are_coalesced_by_housekeeping(greeter, monkeypatch):
+    from cdn_invalidator import RecordingInvalidator
+    invalidator = RecordingInvalidator()
+    monkeypatch.setattr(greeter, "CDN_INVALIDATOR", invalidator)
+
+    for body in ["one", "two", "three"]:
+        greeter.lambda_handler(_post(body), _Ctx())
+    greeter.lambda_handler(_post("keyed", key="topic"), _Ctx())
+    # No CDN call on the request path
+    assert invalidator.batches == []
+
+    greeter.lambda_handler(_HOUSEKEEPING, _Ctx())
+    assert len(invalidator.batches) == 1
+    assert set(invalidator.batches[0]) >= {"/", "/index.html", "/shards/", "/shards/index.html"}
+    assert any(p.endswith("/topic.html") for p in invalidator.batches[0])
+
+    # Nothing new was published, nothing to invalidate
+    greeter.lambda_handler(_HOUSEKEEPING, _Ctx())
+    assert len(invalidator.batches) == 1
+
+
+def test_failed_invalidation_is_requeued(greeter, monkeypatch):
+    from cdn_invalidator import RecordingInvalidator
+    monkeypatch.setattr(greeter, "CDN_INVALIDATOR", _FailingInvalidator())
+    greeter.lambda_handler(_post("hello"), _Ctx())
+    greeter.lambda_handler(_HOUSEKEEPING, _Ctx())
+
+    invalidator = RecordingInvalidator()
+    monkeypatch.setattr(greeter, "CDN_INVALIDATOR", invalidator)
+    greeter.lambda_handler(_HOUSEKEEPING, _Ctx())
+    assert invalidator.batches == [["/", "/index.html"]]
+
+
+def test_large_invalidation_collapses_to_wildcard(greeter, monkeypatch):
+    from cdn_invalidator import RecordingInvalidator
+    invalidator = RecordingInvalidator()
+    monkeypatch.setattr(greeter, "CDN_INVALIDATOR", invalidator)
+    monkeypatch.setattr(greeter.GlobalArgs, "CDN_MAX_PATHS", 3)
+
+    for key in ["a", "b", "c"]:
+        greeter.lambda_handler(_post("hi", key=key), _Ctx())
+    assert greeter.flush_invalidations() == "local-1"
+    assert invalidator.batches == [["/*"]]
+
+
+def test_cloudfront_client_times_out_within_the_function_timeout():
+    pytest.importorskip("boto3")
+    from cdn_invalidator import CloudFrontInvalidator
+    config = CloudFrontInvalidator("E123").client.meta.config
+    attempts = config.retries["total_max_attempts"]
+    assert attempts * (config.connect_timeout + config.read_timeout) < 15
+
+
+def test_single_json_object_is_one_message(greeter):
+    resp = greeter.lambda_handler(_post('{"message": "hi"}', content_type="application/json"), _Ctx())
+    assert resp["statusCode"] == 200
+    assert '<p>{"message": "hi"}</p>' in _index(greeter)
+
+
+def test_json_array_batch(greeter):
+    resp = greeter.lambda_handler(_post('["one", "", "two"]', content_type="application/json"), _Ctx())
+    assert resp["statusCode"] == 200
+    assert json.loads(resp["body"])["message"] == "2 of 3 messages added"
+    assert "<p>one</p><p>two</p>" in _index(greeter)
+
+
+def test_ndjson_batch(greeter):
+    body = '"one"\n"two"\n'
+    resp = greeter.lambda_handler(_post(body, content_type="application/x-ndjson"), _Ctx())
+    assert resp["statusCode"] == 200
+    assert "<p>one</p><p>two</p>" in _index(greeter)
+
+
+@pytest.mark.parametrize("body", ["[]", '[1, {"message": "hi"}, ""]'])
+def test_batch_without_accepted_items_is_rejected(greeter, body):
+    resp = greeter.lambda_handler(_post(body, content_type="application/json"), _Ctx())
+    assert resp["statusCode"] == 400
+    assert json.loads(resp["body"])["message"].startswith("0 of")
+    assert not os.path.exists(greeter.GlobalArgs.INDEX_FILE_PATH)
+
+
+def _sqs_record(message_id, body, content_type="text/plain", key=None):
+    attributes = {"ContentType": {"stringValue": content_type}}
+    if key is not None:
+        attributes["ContentKey"] = {"stringValue": key}
+    return {"eventSource": "aws:sqs", "messageId": message_id, "body": body, "messageAttributes": attributes}
+
+
+def test_sqs_single_json_object_is_one_message(greeter):
+    event = {"Records": [_sqs_record("m-1", '{"message": "hi"}', content_type="application/json")]}
+    assert greeter.lambda_handler(event, _Ctx()) == {"batchItemFailures": []}
+    assert '<p>{"message": "hi"}</p>' in _index(greeter)
+
+
+def test_sqs_batch_is_one_write_per_page(greeter, monkeypatch):
+    writes = []
+    publish_html = greeter.publish_html
+
+    def _counting_publish(html, file_path=None):
+        writes.append(file_path)
+        return publish_html(html, file_path)
+
+    monkeypatch.setattr(greeter, "publish_html", _counting_publish)
+    event = {"Records": [
+        _sqs_record("m-1", "one"),
+        _sqs_record("m-2", "alpha one", key="alpha"),
+        _sqs_record("m-3", '["alpha two", "alpha three"]', content_type="application/json", key="alpha"),
+        _sqs_record("m-4", "beta one", key="beta"),
+    ]}
+    assert greeter.lambda_handler(event, _Ctx()) == {"batchItemFailures": []}
+
+    assert sorted(writes, key=str) == sorted([None, greeter.shard_path("alpha"), greeter.shard_path("beta")], key=str)
+    with open(greeter.shard_path("alpha")) as f:
+        assert "<p>alpha one</p><p>alpha two</p><p>alpha three</p>" in f.read()
+    assert "<p>one</p>" in _index(greeter)
+
+
+def test_sqs_failed_page_reports_only_its_records(greeter, monkeypatch):
+    add_messages = greeter.add_messages
+
+    def _failing_for_beta(msgs, file_path=None, topic=None):
+        if topic == "beta":
+            raise OSError("EFS unavailable")
+        return add_messages(msgs, file_path, topic)
+
+    monkeypatch.setattr(greeter, "add_messages", _failing_for_beta)
+    event = {"Records": [
+        _sqs_record("m-1", "alpha", key="alpha"),
+        _sqs_record("m-2", "beta one", key="beta"),
+        _sqs_record("m-3", "beta two", key="beta"),
+        _sqs_record("m-4", "index"),
+    ]}
+    resp = greeter.lambda_handler(event, _Ctx())
+
+    assert resp == {"batchItemFailures": [{"itemIdentifier": "m-2"}, {"itemIdentifier": "m-3"}]}
+    assert "<p>index</p>" in _index(greeter)
+
+
+def test_sqs_records_that_can_never_be_applied_go_to_the_dlq(greeter, monkeypatch):
+    monkeypatch.setattr(greeter.GlobalArgs, "MAX_BATCH_SIZE", 3)
+    event = {"Records": [
+        _sqs_record("m-1", json.dumps(["x"] * 4), content_type="application/json"),
+        _sqs_record("m-2", "hello", key="bad key!"),
+        _sqs_record("m-3", "[not json", content_type="application/json"),
+        _sqs_record("m-4", "kept"),
+    ]}
+    resp = greeter.lambda_handler(event, _Ctx())
+
+    assert resp == {"batchItemFailures": [
+        {"itemIdentifier": "m-1"}, {"itemIdentifier": "m-2"}, {"itemIdentifier": "m-3"}]}
+    assert "<p>kept</p>" in _index(greeter)
+    assert "<p>x</p>" not in _index(greeter)
+
+
+def test_streamed_post_reaches_the_site(greeter, monkeypatch):
+    monkeypatch.setattr(greeter.GlobalArgs, "SITE_ENABLED", True)
+    monkeypatch.setattr(greeter.GlobalArgs, "STREAM_MIN_BYTES", 16)
+    monkeypatch.setattr(greeter.GlobalArgs, "STREAM_EXCERPT_CHARS", 8)
+
+    greeter.lambda_handler(_post("y" * 64, key="big"), _Ctx())
+    with open(f"{greeter.GlobalArgs.SITE_ROOT}/topics/big.html") as f:
+        page = f.read()
+    assert "<p>yyyyyyyy... [64 characters]</p>" in page
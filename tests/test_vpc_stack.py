@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("aws_cdk.core")
+
+from fargate_with_efs.stacks.back_end.vpc_stack import VpcStack  # noqa: E402
+
+
+ALL_ENDPOINTS = {
+    ("Gateway", "s3"),
+    ("Interface", "ecr.api"),
+    ("Interface", "ecr.dkr"),
+    ("Interface", "logs"),
+    ("Interface", "elasticfilesystem"),
+}
+
+
+def _endpoints(template):
+    """ (endpoint type, service) of every VPC endpoint, com.amazonaws.<region>. stripped """
+    found = set()
+    for props in template.resources("AWS::EC2::VPCEndpoint").values():
+        service_name = props["ServiceName"]["Fn::Join"][1][-1]
+        found.add((props["VpcEndpointType"], service_name.lstrip(".")))
+    return found
+
+
+def _subnet_types(template):
+    """ aws-cdk:subnet-type tag of the app subnets """
+    types = set()
+    for props in template.resources("AWS::EC2::Subnet").values():
+        tags = {tag["Key"]: tag["Value"] for tag in props["Tags"]}
+        if tags["aws-cdk:subnet-name"] == "app":
+            types.add(tags["aws-cdk:subnet-type"])
+    return types
+
+
+@pytest.mark.parametrize(
+    "egress_mode, enable_vpc_endpoints, nat_gateways, endpoints, app_subnet_type",
+    [
+        ("single-nat", False, 1, set(), "Private"),
+        ("single-nat", True, 1, ALL_ENDPOINTS, "Private"),
+        ("per-az-nat", False, 2, set(), "Private"),
+        ("per-az-nat", True, 2, ALL_ENDPOINTS, "Private"),
+        # No NAT, the endpoints are switched on whatever enable_vpc_endpoints says
+        ("endpoints-only", False, 0, ALL_ENDPOINTS, "Isolated"),
+    ]
+)
+def test_endpoints_per_egress_mode(cdk_app, synth, egress_mode, enable_vpc_endpoints, nat_gateways, endpoints, app_subnet_type):
+    stack = VpcStack(cdk_app, "vpc-stack", egress_mode=egress_mode, enable_vpc_endpoints=enable_vpc_endpoints)
+    template = synth(stack)
+
+    assert len(template.resources("AWS::EC2::NatGateway")) == nat_gateways
+    assert _endpoints(template) == endpoints
+    assert _subnet_types(template) == {app_subnet_type}
+    if endpoints:
+        # Interface endpoints live in the app subnets, one ENI per AZ
+        for props in template.resources("AWS::EC2::VPCEndpoint").values():
+            if props["VpcEndpointType"] == "Interface":
+                assert props["PrivateDnsEnabled"] is True
+                assert len(props["SubnetIds"]) == 2
+
+
+def test_unknown_egress_mode(cdk_app):
+    with pytest.raises(ValueError):
+        VpcStack(cdk_app, "vpc-stack", egress_mode="no-nat")